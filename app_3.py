@@ -5,15 +5,23 @@
 # ===== 標準函式庫 =====
 import io
 import os
+import sys
+import time
 import json
 import uuid
+import hashlib
+import html
+import functools
 import traceback
 import logging
 from pathlib import Path
-from typing import Any, Annotated, Dict, List, Optional, Tuple
+from typing import Any, Annotated, Dict, List, Optional, Tuple, TypedDict
 import base64
 import pickle
 import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime
 
@@ -22,23 +30,24 @@ from dotenv import load_dotenv
 load_dotenv()  # 🔥 載入 .env 檔案
 
 # ===== PostgreSQL 相關 =====
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import sql
-from psycopg2.pool import ThreadedConnectionPool
+import asyncpg
 
 # ===== 基礎數值、影像庫 =====
 import numpy as np
 import torch
+import torchvision.transforms.functional as TF
+from torchvision.io import ImageReadMode, decode_jpeg
 from PIL import Image
 
 # ===== Transformer 與模型 =====
-from transformers import CLIPModel, CLIPProcessor
+from transformers import CLIPModel, CLIPImageProcessorFast
 
 # ===== 伺服器與框架 =====
+import aiofiles
+import orjson
 import uvicorn
-from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse, Response, JSONResponse
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, Response, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.exceptions import RequestValidationError
@@ -51,6 +60,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 相同錯誤 (位置 + 例外類型) 在時間窗內只記錄一次完整堆疊，錯誤風暴時其餘只記一行
+ERROR_LOG_INTERVAL = float(os.getenv('ERROR_LOG_INTERVAL', '60'))
+_error_log_times: Dict[Tuple[str, str], float] = {}
+
+def log_exception(message: str, exc: BaseException):
+    """記錄例外；堆疊由 logging 產生，同一錯誤在 ERROR_LOG_INTERVAL 秒內只輸出一次"""
+    key = (message, type(exc).__name__)
+    now = time.monotonic()
+    last = _error_log_times.get(key)
+    if last is not None and now - last < ERROR_LOG_INTERVAL:
+        logger.error(f"{message}: {exc!r}")
+        return
+    _error_log_times[key] = now
+    logger.error(f"{message}: {exc}", exc_info=exc)
+
 # ===== PostgreSQL 配置類 =====
 class DatabaseConfig:
     def __init__(self):
@@ -59,102 +83,194 @@ class DatabaseConfig:
         self.database = os.getenv('DB_NAME', 'book_recognition')
         self.user = os.getenv('DB_USER', 'postgres')
         self.password = os.getenv('DB_PASSWORD', 'postgres')
-        self.pool = None
-        
-        # 初始化連接池
-        self._init_connection_pool()
-        
-    def _init_connection_pool(self):
-        """初始化連接池"""
-        try:
-            self.pool = ThreadedConnectionPool(
-                minconn=1,
-                maxconn=20,
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                cursor_factory=RealDictCursor
-            )
-            logger.info("✅ PostgreSQL 連接池初始化成功")
-        except Exception as e:
-            logger.error(f"❌ 連接池初始化失敗: {e}")
-            raise
-    
-    def get_connection(self):
-        """從連接池獲取連接"""
-        try:
-            if self.pool:
-                conn = self.pool.getconn()
-                if conn:
-                    return conn
-            
-            # 備用：直接連接
-            conn = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                cursor_factory=RealDictCursor
-            )
-            conn.autocommit = False
-            return conn
-        except Exception as e:
-            logger.error(f"資料庫連接失敗: {e}")
-            raise
-    
-    def return_connection(self, conn):
-        """歸還連接到池"""
-        try:
-            if self.pool and conn:
-                self.pool.putconn(conn)
-        except Exception as e:
-            logger.error(f"歸還連接失敗: {e}")
+
+        # asyncpg 非同步連接池 (於事件迴圈內建立)
+        # 建議經由 PgBouncer (transaction 模式，見 pgbouncer.ini) 連線：DB_HOST/DB_PORT 指向 PgBouncer，
+        # 多個 worker 共用少量後端連線，每個進程只需保留少量連線
+        self.async_pool: Optional[asyncpg.Pool] = None
+        self.async_pool_min = int(os.getenv('DB_POOL_MIN', '1'))
+        self.async_pool_max = int(os.getenv('DB_POOL_MAX', '4'))
+        # asyncpg 預設會快取 prepared statement；PgBouncer 1.21 以上需設定 max_prepared_statements，
+        # 較舊版本的 transaction 模式不支援跨交易的 prepared statement，需設為 0
+        self.statement_cache_size = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+        self._async_pool_lock: Optional[asyncio.Lock] = None
     
-    def close_all_connections(self):
-        """關閉所有連接"""
+    async def get_async_pool(self) -> asyncpg.Pool:
+        """取得 asyncpg 連接池；尚未建立時 (例如啟動時資料庫未就緒) 才建立"""
+        if self.async_pool is not None:
+            return self.async_pool
+        if self._async_pool_lock is None:
+            self._async_pool_lock = asyncio.Lock()
+        async with self._async_pool_lock:
+            if self.async_pool is None:
+                self.async_pool = await asyncpg.create_pool(
+                    host=self.host,
+                    port=self.port,
+                    database=self.database,
+                    user=self.user,
+                    password=self.password,
+                    min_size=self.async_pool_min,
+                    max_size=self.async_pool_max,
+                    statement_cache_size=self.statement_cache_size
+                )
+                logger.info(f"✅ asyncpg 連接池初始化成功 (min={self.async_pool_min}, max={self.async_pool_max})")
+        return self.async_pool
+
+    async def close_async_pool(self):
+        """關閉 asyncpg 連接池"""
         try:
-            if self.pool:
-                self.pool.closeall()
-                logger.info("✅ 所有資料庫連接已關閉")
+            if self.async_pool is not None:
+                await self.async_pool.close()
+                self.async_pool = None
+                logger.info("✅ asyncpg 連接池已關閉")
         except Exception as e:
-            logger.error(f"❌ 關閉連接失敗: {e}")
+            logger.error(f"❌ 關閉 asyncpg 連接池失敗: {e}")
 
 # 創建資料庫配置實例
 db_config = DatabaseConfig()
 
 # 初始化 CLIP 模型
+CLIP_MODEL_NAME = "openai/clip-vit-large-patch14"
+CLIP_EMBED_DIM = 768
+
+# GPU 可用時使用 fp16 推論；CPU 維持 fp32
+_device = "cuda" if torch.cuda.is_available() else "cpu"
+_model_dtype = torch.float16 if _device == "cuda" else torch.float32
+
+# 是否以 torch.compile 編譯 (編譯結果依批次大小特化，合併批次需補齊到固定大小)
+_clip_compiled = False
+
+# GPU 推論時 CPU 只負責前處理；多 worker 部署時限制每個進程的執行緒數，避免互相搶占 CPU
+if _device == "cuda":
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+
 try:
-    _clip_model = CLIPModel.from_pretrained("openai/clip-vit-large-patch14").eval()
-    _clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
-    logger.info("✅ CLIP 模型初始化成功")
+    _clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval().to(_device, dtype=_model_dtype)
+    # torch/torchvision 實作的 Fast 前處理器，可直接在 GPU 上處理張量
+    _clip_processor = CLIPImageProcessorFast.from_pretrained(CLIP_MODEL_NAME)
+    _encode_image_features = _clip_model.get_image_features
+
+    # torch.compile 融合 kernel；預設僅在 GPU 啟用 (CLIP_COMPILE=1/0 可強制開關)
+    if os.getenv('CLIP_COMPILE', '1' if _device == "cuda" else '0') == '1':
+        _encode_image_features = torch.compile(
+            _clip_model.get_image_features,
+            mode="reduce-overhead" if _device == "cuda" else "default",
+            fullgraph=False,
+            dynamic=False
+        )
+        _clip_compiled = True
+        logger.info("⚡ CLIP 影像編碼已啟用 torch.compile")
+
+    logger.info(f"✅ CLIP 模型初始化成功 (device={_device}, dtype={_model_dtype})")
 except Exception as e:
     logger.error(f"❌ CLIP 模型初始化失敗: {e}")
     _clip_model = None
     _clip_processor = None
+    _encode_image_features = None
+
+# CLIP 推論工作者: 各請求的影像放入佇列，由單一工作者合併成批次推論
+# 推論固定在專用執行緒執行，避免阻塞事件迴圈，也讓 GPU 呼叫維持在同一執行緒
+# 合併批次以影像張數為上限；啟用 torch.compile 時補零到 CLIP_BATCH_SIZES 中的固定大小，
+# 編譯與 CUDA graph 錄製只發生在預熱的這幾種形狀，不會在請求路徑上遇到新大小
+CLIP_MAX_BATCH_IMAGES = int(os.getenv('CLIP_MAX_BATCH_IMAGES', '32'))
+CLIP_BATCH_SIZES = tuple(sorted({1 << i for i in range(CLIP_MAX_BATCH_IMAGES.bit_length())
+                                 if 1 << i < CLIP_MAX_BATCH_IMAGES} | {CLIP_MAX_BATCH_IMAGES}))
+CLIP_WARMUP_STEPS = int(os.getenv('CLIP_WARMUP_STEPS', '3'))
+_clip_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-inference")
+_clip_queue: Optional[asyncio.Queue] = None
+_clip_worker_task: Optional[asyncio.Task] = None
+
+# 識別時比對的旋轉角度 (批次中的列順序)
+ROTATION_ANGLES = (0, 90, 180, 270)
+
+# 向量儲存格式: 1 = 原始 float32 (舊資料)，2 = 單位化後的 float16
+EMBEDDING_FORMAT_VERSION = 2
+
+# 向量搜尋後端: auto (有 pgvector 擴充時使用資料庫 HNSW 索引) / pgvector / memory
+VECTOR_SEARCH_BACKEND = os.getenv('VECTOR_SEARCH_BACKEND', 'auto').lower()
+PGVECTOR_TOP_K = int(os.getenv('PGVECTOR_TOP_K', '5'))
+
+# 卡通書融合分數只對每個角度餘弦相似度前 K 名計算 (可證明不影響前兩名時才採用，否則改算完整矩陣)
+CARTOON_TOP_K = int(os.getenv('CARTOON_TOP_K', '10'))
+_pgvector_available = False
+
+# 表格結構檢查完成旗標 (啟動時由 lifespan 執行一次，請求路徑不再重複檢查)
+_tables_ready = False
+
+# books 表格欄位名稱 (由 ensure_table 填入，欄位只在部署/修復時變動)
+_books_columns: List[str] = []
+
+# 向量快取: book_id 陣列 + 預先堆疊並單位化的 (N, D) 矩陣 + 原始範數 (N,)
+# 原始範數供卡通書的歐幾里得距離使用；未知 (舊版 float16 列未記錄) 時為 NaN
+# version 對應 embedding_meta 表中的版本號，供多進程部署判斷快取是否過期
+_EMB_CACHE = {
+    "ids": np.array([], dtype=np.int64),
+    "mat": None,
+    "norms": np.array([], dtype=np.float32),
+    "version": None
+}
+_emb_cache_lock = threading.Lock()
+
+# 查詢向量 LRU 快取: 圖片內容雜湊 → (單位化 CLIP 特徵, 原始範數, 是否為卡通書)
+# 特徵為 0 度的 (1, D) 或四角度的 (4, D)，列順序對應 ROTATION_ANGLES
+# 只快取查詢端特徵，不快取比對結果 (書籍資料會變動)
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '512'))
+_query_cache: "OrderedDict[bytes, Tuple[np.ndarray, np.ndarray, bool]]" = OrderedDict()
+_query_cache_lock = threading.Lock()
+_query_cache_stats = {"hits": 0, "misses": 0}
+
+# 旋轉比對統計: 0 度即足夠明確而提前結束 / 需要比對全部四個角度
+_rotation_stats = {"early_exit": 0, "full": 0}
+
+# 快取的目前時間字串: 由背景任務每 CLOCK_TICK_INTERVAL 秒更新，回應中的 timestamp 直接讀取
+CLOCK_TICK_INTERVAL = 0.1
+_NOW_ISO = datetime.now().isoformat()
+_clock_task: Optional[asyncio.Task] = None
+
+async def _tick_clock():
+    """定期更新 _NOW_ISO"""
+    global _NOW_ISO
+    while True:
+        _NOW_ISO = datetime.now().isoformat()
+        await asyncio.sleep(CLOCK_TICK_INTERVAL)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """應用程式生命週期管理"""
+    global _clock_task
     # 啟動事件
     try:
-        ensure_table()
+        await db_config.get_async_pool()
+        await ensure_table()
         logger.info("✅ PostgreSQL資料庫表格檢查完成")
     except Exception as e:
         logger.error(f"❌ PostgreSQL資料庫初始化失敗: {e}")
     
+    try:
+        await asyncio.get_running_loop().run_in_executor(_clip_executor, warmup_clip_model)
+    except Exception as e:
+        logger.error(f"❌ CLIP 模型預熱失敗: {e}")
+    start_clip_worker()
+    refresh_status_snapshot()
+    _clock_task = asyncio.create_task(_tick_clock())
+    
     yield
     
     # 關閉事件
     try:
-        db_config.close_all_connections()
+        _clock_task.cancel()
+        await stop_clip_worker()
+        await db_config.close_async_pool()
         logger.info("✅ 應用關閉，所有資源已清理")
     except Exception as e:
         logger.error(f"❌ 關閉應用時發生錯誤: {e}")
 
-app = FastAPI(title="FastAPI 旋轉增強版書籍識別系統 v3.1 (PostgreSQL完整版)", lifespan=lifespan)
+app = FastAPI(
+    title="FastAPI 旋轉增強版書籍識別系統 v3.1 (PostgreSQL完整版)",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # orjson 編碼 JSON 回應
+)
 
 # 確保目錄存在
 static_dir = Path(__file__).parent / "static"
@@ -165,8 +281,26 @@ static_dir.mkdir(exist_ok=True)
 covers_dir.mkdir(exist_ok=True)
 templates_dir.mkdir(exist_ok=True)
 
+# StaticFiles (follow_symlink=False) 傳入 file_response 的 full_path 已是 realpath，
+# 封面目錄在啟動時解析一次，請求時只需比對字串
+_covers_dir_real = os.path.realpath(covers_dir)
+
+class CachedStaticFiles(StaticFiles):
+    """
+    靜態檔案加上 Cache-Control (ETag / 304 由 StaticFiles 依檔案 mtime 與大小處理)
+    - covers/: 檔名為 uuid，內容永不改變，可永久快取
+    - 其他 (JS/CSS/圖示/sw.js): 檔名不含雜湊，每次以 ETag 重新驗證
+    """
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if os.path.dirname(full_path) == _covers_dir_real:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, no-cache"
+        return response
+
 # 掛載靜態文件和模板
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory=static_dir), name="static")
 templates = Jinja2Templates(directory="templates2")
 
 # ===== Pydantic 模型定義 =====
@@ -176,6 +310,9 @@ class BookModel(BaseModel):
     url: Optional[str] = ""
     image: str
 
+class BulkBookModel(BaseModel):
+    books: List[BookModel]
+
 class SystemStatus(BaseModel):
     clip_available: bool
     clip_status: str
@@ -203,14 +340,53 @@ class ApiResponse(BaseModel):
     book: Optional[BookResponse] = None
     data: Optional[Any] = None
 
+# ===== 回應型別 (TypedDict，僅供型別標示，直接交給 ORJSONResponse 不經 Pydantic 驗證) =====
+class BookRecord(TypedDict):
+    id: int
+    title: str
+    isbn: str
+    url: str
+    cover_path: str
+    created_at: Optional[datetime]
+    has_clip: bool
+    tech_type: str
+
+class BooksPage(TypedDict):
+    success: bool
+    data: List[BookRecord]
+    total: int
+    next_before_id: Optional[int]
+    system: str
+    database: str
+    table_columns: List[str]
+
+class HealthDatabase(TypedDict):
+    connected: bool
+    book_count: int
+    book_count_estimated: bool
+    type: str
+    host: str
+    database: str
+
+class HealthClipModel(TypedDict):
+    status: str
+    available: bool
+
+class HealthStatus(TypedDict):
+    success: bool
+    status: str
+    database: HealthDatabase
+    clip_model: HealthClipModel
+    query_cache: Dict[str, Any]
+    timestamp: str
+
 # ===== 全域異常處理器 =====
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """全域異常處理器，確保所有錯誤都返回JSON格式"""
-    logger.error(f"全域異常: {exc}")
-    logger.error(f"異常詳情: {traceback.format_exc()}")
+    log_exception("全域異常", exc)
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
@@ -225,7 +401,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     """HTTP 異常處理器"""
     logger.error(f"HTTP 異常: {exc.status_code} - {exc.detail}")
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
@@ -240,7 +416,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     """請求驗證錯誤處理器"""
     logger.error(f"請求驗證錯誤: {exc}")
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=422,
         content={
             "success": False,
@@ -251,138 +427,610 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 # ===== 資料庫操作函數 =====
-def ensure_table():
+async def ensure_table():
     """確保資料庫表格存在並更新結構 - PostgreSQL版本"""
+    global _pgvector_available, _tables_ready, _books_columns
     logger.info(f"🔧 檢查PostgreSQL資料庫表格")
     
-    conn = None
     try:
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        # 檢查 books 表格是否存在
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'books'
-            );
-        """)
-        books_table_exists = cursor.fetchone()[0]
-        
-        if books_table_exists:
-            # 檢查 books 表格的欄位結構
-            cursor.execute("""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_schema = 'public' 
-                AND table_name = 'books'
-                ORDER BY ordinal_position;
-            """)
-            columns_info = cursor.fetchall()
-            column_names = [col['column_name'] for col in columns_info]
-            logger.info(f"📋 現有 books 表格欄位: {column_names}")
-            
-            # 檢查是否缺少 cover_path 欄位
-            if 'cover_path' not in column_names:
-                logger.info("⚡ 添加 cover_path 欄位")
-                cursor.execute("ALTER TABLE books ADD COLUMN cover_path TEXT")
-            
-            # 檢查是否缺少 created_at 欄位
-            if 'created_at' not in column_names:
-                logger.info("⚡ 添加 created_at 欄位")
-                cursor.execute("ALTER TABLE books ADD COLUMN created_at TIMESTAMP DEFAULT NOW()")
-                cursor.execute("UPDATE books SET created_at = NOW() WHERE created_at IS NULL")
-                logger.info("⏰ 已為現有記錄設置創建時間")
-        else:
-            # 建立新的 books 表格
-            logger.info("🆕 建立新的 books 表格")
-            cursor.execute("""
-                CREATE TABLE books (
-                    id SERIAL PRIMARY KEY,
-                    title TEXT NOT NULL,
-                    isbn TEXT,
-                    url TEXT,
-                    cover_path TEXT,
-                    created_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-
-        # 建立 cover_embeddings 表格
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cover_embeddings (
-                book_id INTEGER PRIMARY KEY,
-                vector BYTEA,
-                FOREIGN KEY(book_id) REFERENCES books(id) ON DELETE CASCADE
-            );
-        """)
-        
-        # 添加索引提升性能
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_books_title 
-            ON books USING btree (title);
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_books_created_at 
-            ON books USING btree (created_at DESC);
-        """)
-        
-        # 檢查現有資料
-        cursor.execute("SELECT COUNT(*) FROM books")
-        book_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM cover_embeddings")
-        embedding_count = cursor.fetchone()[0]
-        
-        logger.info(f"📚 現有書籍記錄: {book_count}")
-        logger.info(f"🧠 現有向量記錄: {embedding_count}")
-        
-        # 顯示幾筆書籍資料
-        if book_count > 0:
-            cursor.execute("SELECT id, title, cover_path FROM books ORDER BY id DESC LIMIT 3")
-            recent_books = cursor.fetchall()
-            logger.info("📖 最近的書籍:")
-            for book in recent_books:
-                logger.info(f"   ID: {book['id']}, 標題: '{book['title']}', 封面: '{book['cover_path'] or '無'}'")
-        
-        conn.commit()
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # 檢查 books 表格是否存在
+                books_table_exists = await conn.fetchval("""
+                    SELECT EXISTS (
+                        SELECT FROM information_schema.tables 
+                        WHERE table_schema = 'public' 
+                        AND table_name = 'books'
+                    );
+                """)
+                
+                if books_table_exists:
+                    # 檢查 books 表格的欄位結構
+                    columns_info = await conn.fetch("""
+                        SELECT column_name, data_type 
+                        FROM information_schema.columns 
+                        WHERE table_schema = 'public' 
+                        AND table_name = 'books'
+                        ORDER BY ordinal_position;
+                    """)
+                    column_names = [col['column_name'] for col in columns_info]
+                    logger.info(f"📋 現有 books 表格欄位: {column_names}")
+                    
+                    # 檢查是否缺少 cover_path 欄位
+                    if 'cover_path' not in column_names:
+                        logger.info("⚡ 添加 cover_path 欄位")
+                        await conn.execute("ALTER TABLE books ADD COLUMN cover_path TEXT")
+                        column_names.append('cover_path')
+                    
+                    # 檢查是否缺少 created_at 欄位
+                    if 'created_at' not in column_names:
+                        logger.info("⚡ 添加 created_at 欄位")
+                        await conn.execute("ALTER TABLE books ADD COLUMN created_at TIMESTAMP DEFAULT NOW()")
+                        await conn.execute("UPDATE books SET created_at = NOW() WHERE created_at IS NULL")
+                        logger.info("⏰ 已為現有記錄設置創建時間")
+                        column_names.append('created_at')
+                else:
+                    # 建立新的 books 表格
+                    logger.info("🆕 建立新的 books 表格")
+                    await conn.execute("""
+                        CREATE TABLE books (
+                            id SERIAL PRIMARY KEY,
+                            title TEXT NOT NULL,
+                            isbn TEXT,
+                            url TEXT,
+                            cover_path TEXT,
+                            created_at TIMESTAMP DEFAULT NOW()
+                        );
+                    """)
+                    column_names = ['id', 'title', 'isbn', 'url', 'cover_path', 'created_at']
+
+                # 建立 cover_embeddings 表格
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS cover_embeddings (
+                        book_id INTEGER PRIMARY KEY,
+                        vector BYTEA,
+                        FOREIGN KEY(book_id) REFERENCES books(id) ON DELETE CASCADE
+                    );
+                """)
+
+                # 舊資料沒有格式欄位，預設標記為 float32 (版本 1)，讀取時再轉換
+                await conn.execute("""
+                    ALTER TABLE cover_embeddings
+                    ADD COLUMN IF NOT EXISTS embedding_version SMALLINT NOT NULL DEFAULT 1
+                """)
+
+                # 單位化儲存後保留原始 CLIP 特徵範數 (卡通書的歐幾里得距離以原始尺度計算)
+                await conn.execute("""
+                    ALTER TABLE cover_embeddings
+                    ADD COLUMN IF NOT EXISTS vector_norm REAL
+                """)
+
+                # 建立 embedding_meta 表格 (向量版本號，寫入/刪除時遞增)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS embedding_meta (
+                        id INTEGER PRIMARY KEY,
+                        version BIGINT NOT NULL DEFAULT 0
+                    );
+                """)
+                await conn.execute("""
+                    INSERT INTO embedding_meta(id, version) VALUES (1, 0)
+                    ON CONFLICT (id) DO NOTHING
+                """)
+
+                # pgvector (可選): 建立 vector 欄位與 HNSW 索引，讓相似度搜尋在資料庫內完成
+                # 巢狀交易即 SAVEPOINT，擴充不可用時只回滾這一段
+                try:
+                    async with conn.transaction():
+                        await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                        await conn.execute(f"""
+                            ALTER TABLE cover_embeddings
+                            ADD COLUMN IF NOT EXISTS embedding vector({CLIP_EMBED_DIM})
+                        """)
+                        await conn.execute("""
+                            CREATE INDEX IF NOT EXISTS idx_cover_embeddings_hnsw
+                            ON cover_embeddings USING hnsw (embedding vector_cosine_ops)
+                        """)
+                    _pgvector_available = True
+                except asyncpg.PostgresError as e:
+                    _pgvector_available = False
+                    logger.info(f"ℹ️ pgvector 擴充不可用，使用記憶體向量搜尋: {e}")
+
+                if _pgvector_available:
+                    await backfill_pgvector_column(conn)
+                
+                # 添加索引提升性能
+                # 沒有任何查詢以 title 搜尋 (識別完全依 CLIP 向量)，移除舊的 title 索引以減少寫入成本
+                await conn.execute("DROP INDEX IF EXISTS idx_books_title")
+                
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_books_created_at 
+                    ON books USING btree (created_at DESC);
+                """)
+                
+                # 檢查現有資料
+                book_count = await conn.fetchval("SELECT COUNT(*) FROM books")
+                embedding_count = await conn.fetchval("SELECT COUNT(*) FROM cover_embeddings")
+                
+                logger.info(f"📚 現有書籍記錄: {book_count}")
+                logger.info(f"🧠 現有向量記錄: {embedding_count}")
+                
+                # 顯示幾筆書籍資料
+                if book_count > 0:
+                    recent_books = await conn.fetch("SELECT id, title, cover_path FROM books ORDER BY id DESC LIMIT 3")
+                    logger.info("📖 最近的書籍:")
+                    for book in recent_books:
+                        logger.info(f"   ID: {book['id']}, 標題: '{book['title']}', 封面: '{book['cover_path'] or '無'}'")
+        
+        _books_columns = column_names
+        _tables_ready = True
         
     except Exception as e:
-        logger.error(f"資料庫表格檢查失敗: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
-        if conn:
-            conn.rollback()
+        log_exception("資料庫表格檢查失敗", e)
         raise
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
-def save_uploaded_image(image_data: bytes, book_id: int) -> str:
-    """儲存上傳的圖片到 static/covers 目錄"""
+async def bump_embedding_version(conn) -> int:
+    """遞增向量版本號 (需在同一交易中與向量變更一起提交)"""
+    return await conn.fetchval("UPDATE embedding_meta SET version = version + 1 WHERE id = 1 RETURNING version")
+
+# 多處共用的單筆查詢集中為常數，避免各處字串不一致 (純整理，效能不變：
+# asyncpg 本來就依查詢字串快取 prepared statement，相同字面字串原本即共用同一快取項目)
+GET_BOOK_INFO_SQL = "SELECT title, isbn, url FROM books WHERE id = $1"
+GET_BOOK_COVER_SQL = "SELECT title, cover_path FROM books WHERE id = $1"
+GET_BOOK_TITLE_SQL = "SELECT title FROM books WHERE id = $1"
+DELETE_BOOK_SQL = "DELETE FROM books WHERE id = $1 RETURNING cover_path"
+
+# 新增書籍: 書籍、向量與版本號遞增在同一語句內完成 (資料修改 CTE)
+INSERT_BOOK_WITH_EMBEDDING_SQL = """
+    WITH inserted AS (
+        INSERT INTO books(title, isbn, url, cover_path, created_at)
+        VALUES($1, $2, $3, $4, NOW())
+        RETURNING id
+    ), emb AS (
+        INSERT INTO cover_embeddings(book_id, vector, embedding_version, vector_norm)
+        SELECT id, $5, $6, $7 FROM inserted
+    ), ver AS (
+        UPDATE embedding_meta SET version = version + 1 WHERE id = 1 RETURNING version
+    )
+    SELECT inserted.id, ver.version FROM inserted, ver
+"""
+
+INSERT_BOOK_WITH_EMBEDDING_PGVECTOR_SQL = """
+    WITH inserted AS (
+        INSERT INTO books(title, isbn, url, cover_path, created_at)
+        VALUES($1, $2, $3, $4, NOW())
+        RETURNING id
+    ), emb AS (
+        INSERT INTO cover_embeddings(book_id, vector, embedding_version, vector_norm, embedding)
+        SELECT id, $5, $6, $7, $8::text::vector FROM inserted
+    ), ver AS (
+        UPDATE embedding_meta SET version = version + 1 WHERE id = 1 RETURNING version
+    )
+    SELECT inserted.id, ver.version FROM inserted, ver
+"""
+
+# 批次新增書籍: UNNEST 展開陣列參數，一個語句寫入全部書籍與向量
+# 先以 nextval 配好 ID (src 被多次引用，只會計算一次)，書籍與向量列可直接對應，並依輸入順序回傳 ID
+INSERT_BOOKS_BULK_SQL = """
+    WITH src AS (
+        SELECT nextval(pg_get_serial_sequence('books', 'id')) AS id, t, i, u, c, v, n, ord
+        FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::bytea[], $7::real[])
+             WITH ORDINALITY AS x(t, i, u, c, v, n, ord)
+    ), inserted AS (
+        INSERT INTO books(id, title, isbn, url, cover_path, created_at)
+        SELECT id, t, i, u, c, NOW() FROM src
+    ), emb AS (
+        INSERT INTO cover_embeddings(book_id, vector, embedding_version, vector_norm)
+        SELECT id, v, $6, n FROM src
+    ), ver AS (
+        UPDATE embedding_meta SET version = version + 1 WHERE id = 1 RETURNING version
+    )
+    SELECT array_agg(src.id ORDER BY src.ord) AS ids, (SELECT version FROM ver) AS version FROM src
+"""
+
+INSERT_BOOKS_BULK_PGVECTOR_SQL = """
+    WITH src AS (
+        SELECT nextval(pg_get_serial_sequence('books', 'id')) AS id, t, i, u, c, v, n, pv, ord
+        FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::bytea[], $7::real[], $8::text[])
+             WITH ORDINALITY AS x(t, i, u, c, v, n, pv, ord)
+    ), inserted AS (
+        INSERT INTO books(id, title, isbn, url, cover_path, created_at)
+        SELECT id, t, i, u, c, NOW() FROM src
+    ), emb AS (
+        INSERT INTO cover_embeddings(book_id, vector, embedding_version, vector_norm, embedding)
+        SELECT id, v, $6, n, pv::vector FROM src
+    ), ver AS (
+        UPDATE embedding_meta SET version = version + 1 WHERE id = 1 RETURNING version
+    )
+    SELECT array_agg(src.id ORDER BY src.ord) AS ids, (SELECT version FROM ver) AS version FROM src
+"""
+
+def split_norms(mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """回傳 (L2 單位化矩陣, 每列原始範數 (N,))；零向量保持為零"""
+    norms = np.linalg.norm(mat, axis=1)
+    return mat / np.where(norms == 0, 1.0, norms)[:, None], norms.astype(np.float32)
+
+def normalize_rows(mat: np.ndarray) -> np.ndarray:
+    """L2 單位化每一列；零向量保持為零"""
+    return split_norms(mat)[0]
+
+def decode_embedding(raw, embedding_version: int, vector_norm: Optional[float]) -> Tuple[np.ndarray, float]:
+    """
+    將 BYTEA 向量解碼為 (單位化 float16, 原始範數)，相容舊版 float32 格式
+    舊版 float32 的範數直接由原始向量計算；缺少範數記錄時回傳 NaN
+    """
+    if embedding_version == EMBEDDING_FORMAT_VERSION:
+        return np.frombuffer(raw, dtype=np.float16), np.nan if vector_norm is None else float(vector_norm)
+    unit, norms = split_norms(np.frombuffer(raw, dtype=np.float32).reshape(1, -1))
+    return unit[0].astype(np.float16), float(norms[0])
+
+def to_pgvector(vector: np.ndarray) -> str:
+    """轉為 pgvector 的文字格式 '[x1,x2,...]'"""
+    return "[" + ",".join(f"{x:.6g}" for x in vector.astype(np.float32)) + "]"
+
+def use_pgvector_search() -> bool:
+    """是否將相似度搜尋交給 pgvector"""
+    if VECTOR_SEARCH_BACKEND == "memory":
+        return False
+    return _pgvector_available
+
+async def backfill_pgvector_column(conn):
+    """
+    為尚未寫入 pgvector 欄位的舊資料補上向量；舊格式 (float32) 的列同時轉存為單位化 float16，
+    並將由原始向量算出的範數寫入 vector_norm (pgvector 後端不會經過記憶體快取的轉換)
+    """
+    rows = await conn.fetch("""
+        SELECT book_id, vector, embedding_version, vector_norm
+        FROM cover_embeddings
+        WHERE vector IS NOT NULL AND (embedding IS NULL OR embedding_version <> $1)
+    """, EMBEDDING_FORMAT_VERSION)
+    if not rows:
+        return
+    updates = []
+    for row in rows:
+        vector, norm = decode_embedding(row['vector'], row['embedding_version'], row['vector_norm'])
+        # asyncpg 沒有 vector 型別的編碼器，以文字傳入再轉型；未知範數維持 NULL
+        updates.append((to_pgvector(vector), vector.tobytes(), EMBEDDING_FORMAT_VERSION,
+                        None if np.isnan(norm) else norm, row['book_id']))
+    await conn.executemany("""
+        UPDATE cover_embeddings
+        SET embedding = $1::text::vector, vector = $2, embedding_version = $3, vector_norm = $4
+        WHERE book_id = $5
+    """, updates)
+    logger.info(f"🧭 已為 {len(rows)} 筆向量補上 pgvector 欄位 (含舊格式轉存與原始範數)")
+
+async def search_pgvector(conn, query_unit: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    以 pgvector HNSW 索引取得每個旋轉角度的前 K 名，一次查詢完成
+    回傳 (候選 book_ids, (角度數, 候選數) 餘弦相似度矩陣, 候選原始範數)，未入榜的位置為 -inf
+    """
+    rows = await conn.fetch(f"""
+        SELECT q.idx, c.book_id, c.vector_norm, 1 - (c.embedding <=> q.vec) AS sim
+        FROM (
+            SELECT (ord - 1)::int AS idx, v::vector({CLIP_EMBED_DIM}) AS vec
+            FROM unnest($1::text[]) WITH ORDINALITY AS t(v, ord)
+        ) q
+        CROSS JOIN LATERAL (
+            SELECT book_id, embedding, vector_norm
+            FROM cover_embeddings
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> q.vec
+            LIMIT $2
+        ) c
+    """, [to_pgvector(row) for row in query_unit], PGVECTOR_TOP_K)
+
+    ids = np.array(sorted({row['book_id'] for row in rows}), dtype=np.int64)
+    cos = np.full((len(query_unit), len(ids)), -np.inf, dtype=np.float32)
+    norms = np.full(len(ids), np.nan, dtype=np.float32)
+    columns = {int(book_id): i for i, book_id in enumerate(ids)}
+    for row in rows:
+        col = columns[row['book_id']]
+        cos[row['idx'], col] = row['sim']
+        if row['vector_norm'] is not None:
+            norms[col] = row['vector_norm']
+    return ids, cos, norms
+
+async def load_embeddings_if_stale(conn) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """
+    取得 (book_ids, 單位化向量矩陣, 原始範數)，僅在資料庫版本與快取不一致時重新載入
+    舊格式 (float32) 的向量會在載入時轉存為單位化 float16，原始範數一併寫入 vector_norm
+    """
+    db_version = await conn.fetchval("SELECT version FROM embedding_meta WHERE id = 1") or 0
+
+    with _emb_cache_lock:
+        if _EMB_CACHE["version"] == db_version:
+            return _EMB_CACHE["ids"], _EMB_CACHE["mat"], _EMB_CACHE["norms"]
+
+    logger.info(f"🔍 向量快取過期 (版本 {_EMB_CACHE['version']} → {db_version})，從PostgreSQL重新載入")
+    book_ids = []
+    vectors = []
+    norms = []
+    migrated = []
+    # 伺服器端游標分批讀取 (每批 1000 筆)，避免一次載入所有列
+    async with conn.transaction():
+        async for row in conn.cursor(
+            "SELECT book_id, vector, embedding_version, vector_norm FROM cover_embeddings ORDER BY book_id",
+            prefetch=1000
+        ):
+            vector, norm = decode_embedding(row['vector'], row['embedding_version'], row['vector_norm'])
+            book_ids.append(row['book_id'])
+            vectors.append(vector)
+            norms.append(norm)
+            if row['embedding_version'] != EMBEDDING_FORMAT_VERSION:
+                migrated.append((vector.tobytes(), EMBEDDING_FORMAT_VERSION, norm, row['book_id']))
+
+    ids = np.array(book_ids, dtype=np.int64)
+
+    if migrated:
+        await conn.executemany(
+            "UPDATE cover_embeddings SET vector = $1, embedding_version = $2, vector_norm = $3 WHERE book_id = $4",
+            migrated
+        )
+        logger.info(f"♻️ 已將 {len(migrated)} 筆舊格式向量轉存為 float16")
+
+    mat = normalize_rows(np.stack(vectors).astype(np.float32)) if vectors else None
+    norms = np.array(norms, dtype=np.float32)
+
+    with _emb_cache_lock:
+        _EMB_CACHE.update({"ids": ids, "mat": mat, "norms": norms, "version": db_version})
+    logger.info(f"📊 向量快取已載入 {len(ids)} 筆記錄")
+    return ids, mat, norms
+
+def cache_add_embedding(book_id: int, emb: np.ndarray, norm: float, new_version: int):
+    """新增向量後直接附加到快取；若快取已落後其他進程則留待下次重新載入"""
+    cache_add_embeddings([book_id], emb.reshape(1, -1), np.array([norm], dtype=np.float32), new_version)
+
+def cache_add_embeddings(book_ids: List[int], embs: np.ndarray, norms: np.ndarray, new_version: int):
+    """一次附加多筆向量與其原始範數 (同一次版本遞增寫入)"""
+    with _emb_cache_lock:
+        if _EMB_CACHE["version"] != new_version - 1:
+            return
+        new_ids = np.asarray(book_ids, dtype=np.int64)
+        unit = normalize_rows(embs.astype(np.float32))
+        ids = _EMB_CACHE["ids"]
+        keep = ~np.isin(ids, new_ids)
+        if _EMB_CACHE["mat"] is None:
+            _EMB_CACHE["mat"] = unit
+        else:
+            _EMB_CACHE["mat"] = np.vstack([_EMB_CACHE["mat"][keep], unit])
+        _EMB_CACHE["norms"] = np.concatenate([_EMB_CACHE["norms"][keep], norms.astype(np.float32)])
+        _EMB_CACHE["ids"] = np.concatenate([ids[keep], new_ids])
+        _EMB_CACHE["version"] = new_version
+
+def cache_remove_embedding(book_id: int, new_version: int):
+    """刪除書籍後同步移除快取中的向量"""
+    with _emb_cache_lock:
+        if _EMB_CACHE["version"] != new_version - 1:
+            return
+        keep = _EMB_CACHE["ids"] != book_id
+        if _EMB_CACHE["mat"] is not None:
+            _EMB_CACHE["mat"] = _EMB_CACHE["mat"][keep] if keep.any() else None
+        _EMB_CACHE["norms"] = _EMB_CACHE["norms"][keep]
+        _EMB_CACHE["ids"] = _EMB_CACHE["ids"][keep]
+        _EMB_CACHE["version"] = new_version
+
+def decode_base64_image(image_str: str) -> bytes:
+    """解碼 base64 圖片字串 (接受 data URL 格式)"""
+    if image_str.startswith("data:") and "," in image_str:
+        _, b64data = image_str.split(",", 1)
+    else:
+        b64data = image_str
+    image_bytes = base64.b64decode(b64data)
+    if len(image_bytes) == 0:
+        raise ValueError("Base64 解碼後圖片為空")
+    return image_bytes
+
+async def save_uploaded_image(image_data: bytes) -> str:
+    """儲存上傳的圖片到 static/covers 目錄 (檔名不依賴書籍 ID，可在寫入資料庫前完成)"""
     try:
         # 生成檔案名稱
-        filename = f"book_{book_id}_{uuid.uuid4().hex[:8]}.jpg"
+        filename = f"book_{uuid.uuid4().hex}.jpg"
         file_path = covers_dir / filename
         
-        # 儲存圖片
-        with open(file_path, 'wb') as f:
-            f.write(image_data)
+        # 儲存圖片 - 非同步寫入，不阻塞事件迴圈
+        async with aiofiles.open(file_path, 'wb') as f:
+            await f.write(image_data)
         
         return str(file_path)
     except Exception as e:
         logger.error(f"儲存圖片失敗: {e}")
         return ""
 
-def detect_cartoon_book_simple(pil_image):
-    """簡單檢測卡通風格書籍"""
+def load_image_tensor(img_bytes: bytes) -> Tuple[Optional[Image.Image], torch.Tensor]:
+    """
+    解碼一次圖片，回傳 (PIL 影像或 None, 位於推論裝置上的 (3, H, W) uint8 張量)
+    GPU 上的 JPEG 直接以 nvJPEG 解碼到顯示卡記憶體 (此時不產生 PIL 影像)，其餘格式使用 PIL
+    """
+    if _device == "cuda" and img_bytes[:3] == b"\xff\xd8\xff":
+        try:
+            raw = torch.frombuffer(img_bytes, dtype=torch.uint8)
+            return None, decode_jpeg(raw, mode=ImageReadMode.RGB, device=_device)
+        except RuntimeError as e:
+            logger.warning(f"⚠️ GPU JPEG 解碼失敗，改用 PIL: {e}")
+
+    pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    return pil_img, TF.pil_to_tensor(pil_img).to(_device)
+
+def preprocess_images(images) -> torch.Tensor:
+    """圖片張量 (或張量列表) → 位於推論裝置上的 (批次, 3, 224, 224) pixel_values"""
+    inputs = _clip_processor(images=images, return_tensors="pt", device=_device)
+    return inputs["pixel_values"].to(_device, dtype=_model_dtype)
+
+def preprocess_image_bytes(img_bytes: bytes) -> torch.Tensor:
+    """解碼並前處理單張圖片 → (1, 3, 224, 224) pixel_values (同步，需在執行緒中呼叫)"""
+    return preprocess_images(load_image_tensor(img_bytes)[1])
+
+def encode_pixel_values(pixel_values: torch.Tensor) -> np.ndarray:
+    """pixel_values → CLIP 特徵，回傳 (批次, D) 的 float32 陣列"""
+    with torch.inference_mode():
+        features = _encode_image_features(pixel_values=pixel_values)
+    return features.float().cpu().numpy()
+
+def encode_images(images) -> np.ndarray:
+    """將圖片張量 (或張量列表) 編碼為 CLIP 特徵 (同步版本)"""
+    return encode_pixel_values(preprocess_images(images))
+
+def clip_batch_size(n: int) -> int:
+    """n 張影像實際送入模型的批次大小: 已編譯時補齊到 CLIP_BATCH_SIZES，否則維持原大小"""
+    if not _clip_compiled:
+        return n
+    return next((size for size in CLIP_BATCH_SIZES if size >= n), n)
+
+def encode_batch(pixel_values: torch.Tensor) -> np.ndarray:
+    """補零到固定批次大小後編碼，只回傳實際影像的特徵"""
+    n = pixel_values.shape[0]
+    size = clip_batch_size(n)
+    if size > n:
+        pixel_values = torch.cat([pixel_values, pixel_values.new_zeros((size - n, *pixel_values.shape[1:]))])
+    return encode_pixel_values(pixel_values)[:n]
+
+def warmup_clip_model():
+    """
+    以空白影像執行幾次前向推論，讓 cuDNN 選定 kernel、torch.compile 完成編譯，
+    避免第一個真實請求承擔冷啟動延遲 (需在推論執行緒中呼叫)
+    """
+    if _clip_model is None or CLIP_WARMUP_STEPS <= 0:
+        return
+    # 已編譯: 逐一預熱所有固定批次大小 (每種大小各自編譯並錄製 CUDA graph)；
+    # 未編譯: 單張 (儲存 / 0 度識別) 與其餘三個角度兩種常見批次大小
+    warmup_sizes = CLIP_BATCH_SIZES if _clip_compiled else (1, len(ROTATION_ANGLES) - 1)
+    for batch_size in warmup_sizes:
+        dummy = torch.zeros(batch_size, 3, 224, 224, device=_device, dtype=_model_dtype)
+        for _ in range(CLIP_WARMUP_STEPS):
+            encode_pixel_values(dummy)
+    if _device == "cuda":
+        torch.cuda.synchronize()
+    logger.info(f"🔥 CLIP 模型預熱完成 (批次大小 {list(warmup_sizes)}，各 {CLIP_WARMUP_STEPS} 次)")
+
+async def _clip_worker():
+    """取出佇列中所有待處理的請求 (合計最多 CLIP_MAX_BATCH_IMAGES 張影像)，合併成一次前向推論"""
+    loop = asyncio.get_running_loop()
+    carry = None  # 放不進上一批的請求，留待下一批最先處理
+    while True:
+        batch = [carry if carry is not None else await _clip_queue.get()]
+        carry = None
+        n_images = batch[0][0].shape[0]
+        while not _clip_queue.empty():
+            item = _clip_queue.get_nowait()
+            if n_images + item[0].shape[0] > CLIP_MAX_BATCH_IMAGES:
+                carry = item
+                break
+            batch.append(item)
+            n_images += item[0].shape[0]
+
+        try:
+            pixel_values = torch.cat([pv for pv, _ in batch], dim=0)
+            features = await loop.run_in_executor(_clip_executor, encode_batch, pixel_values)
+        except Exception as e:
+            logger.error(f"❌ CLIP 批次推論失敗: {e}")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+
+        if len(batch) > 1:
+            logger.info(f"⚡ CLIP 合併批次推論: {len(batch)} 個請求, {len(features)} 張影像")
+
+        offset = 0
+        for pv, fut in batch:
+            n = pv.shape[0]
+            if not fut.done():
+                fut.set_result(features[offset:offset + n])
+            offset += n
+
+def start_clip_worker():
+    """啟動 CLIP 推論工作者 (需在事件迴圈內呼叫)"""
+    global _clip_queue, _clip_worker_task
+    if _clip_model is None or _clip_worker_task is not None:
+        return
+    _clip_queue = asyncio.Queue()
+    _clip_worker_task = asyncio.create_task(_clip_worker())
+    logger.info(f"✅ CLIP 推論工作者已啟動 (最大合併影像數: {CLIP_MAX_BATCH_IMAGES}，批次大小: {list(CLIP_BATCH_SIZES)})")
+
+async def stop_clip_worker():
+    """停止 CLIP 推論工作者"""
+    global _clip_queue, _clip_worker_task
+    if _clip_worker_task is None:
+        return
+    _clip_worker_task.cancel()
+    try:
+        await _clip_worker_task
+    except asyncio.CancelledError:
+        pass
+    _clip_queue = None
+    _clip_worker_task = None
+
+async def embed_pixel_values(pixel_values: torch.Tensor) -> np.ndarray:
+    """將 pixel_values 交給推論工作者與其他請求合併批次編碼，回傳 (批次, D) 的 float32 陣列"""
+    if pixel_values.shape[0] > CLIP_MAX_BATCH_IMAGES:
+        # 大批次 (例如批次新增) 依影像張數切塊送入，每塊不超過單一合併批次的上限
+        chunks = torch.split(pixel_values, CLIP_MAX_BATCH_IMAGES)
+        return np.concatenate(await asyncio.gather(*(embed_pixel_values(chunk) for chunk in chunks)))
+
+    if _clip_queue is None:
+        # 工作者未啟動 (例如未經 lifespan 執行) 時直接在推論執行緒編碼
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_clip_executor, encode_batch, pixel_values)
+
+    fut = asyncio.get_running_loop().create_future()
+    await _clip_queue.put((pixel_values, fut))
+    return await fut
+
+def image_cache_key(img_bytes: bytes) -> bytes:
+    """圖片內容雜湊，作為查詢快取的鍵值"""
+    return hashlib.blake2b(img_bytes, digest_size=16).digest()
+
+def query_cache_get(key: bytes) -> Optional[Tuple[np.ndarray, np.ndarray, bool]]:
+    """查詢快取；命中時移到最近使用的位置"""
+    with _query_cache_lock:
+        entry = _query_cache.get(key)
+        if entry is None:
+            _query_cache_stats["misses"] += 1
+            return None
+        _query_cache.move_to_end(key)
+        _query_cache_stats["hits"] += 1
+        return entry
+
+def query_cache_put(key: bytes, query_embs: np.ndarray, query_norms: np.ndarray, is_cartoon: bool):
+    """寫入快取，超過容量時淘汰最久未使用的項目"""
+    if QUERY_CACHE_SIZE <= 0:
+        return
+    query_embs.flags.writeable = False
+    query_norms.flags.writeable = False
+    with _query_cache_lock:
+        _query_cache[key] = (query_embs, query_norms, is_cartoon)
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+
+def query_cache_stats() -> Dict[str, Any]:
+    """查詢快取統計"""
+    with _query_cache_lock:
+        hits, misses = _query_cache_stats["hits"], _query_cache_stats["misses"]
+        total = hits + misses
+        return {
+            "size": len(_query_cache),
+            "capacity": QUERY_CACHE_SIZE,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+def detect_cartoon_book_simple(image):
+    """簡單檢測卡通風格書籍 (接受 PIL 影像或 (3, H, W) uint8 張量)"""
     try:
-        import numpy as np
-        img_array = np.array(pil_image)
-        
-        # 1. 檢測主要顏色
-        r_mean = np.mean(img_array[:, :, 0])
-        g_mean = np.mean(img_array[:, :, 1])
-        b_mean = np.mean(img_array[:, :, 2])
+        if isinstance(image, torch.Tensor):
+            # GPU 解碼的張量: 直接在裝置上做一次通道加總
+            h, w = image.shape[-2:]
+            channel_means = image.sum(dim=(-2, -1), dtype=torch.float64) / (h * w)
+            r_mean, g_mean, b_mean = channel_means.cpu().tolist()
+        else:
+            # 先以 BOX 濾鏡縮成 64x64 (每個像素為原圖區塊平均，整體均值不變)，
+            # 避免把整張大圖複製成 NumPy 陣列
+            thumb = np.asarray(image.resize((64, 64), Image.BOX), dtype=np.float32)
+            
+            # 1. 檢測主要顏色 (單次計算三個通道平均)
+            r_mean, g_mean, b_mean = thumb.reshape(-1, 3).mean(axis=0)
         
         # 2. 檢測顏色飽和度
         color_variance = np.var([r_mean, g_mean, b_mean])
@@ -399,141 +1047,263 @@ def detect_cartoon_book_simple(pil_image):
         logger.error(f"卡通檢測失敗: {e}")
         return False
 
+def analyze_query_image(img_bytes: bytes) -> Tuple[torch.Tensor, bool]:
+    """解碼一次查詢圖片 → (0 度 pixel_values, 是否為卡通書) (同步，需在執行緒中呼叫)"""
+    pil_img, img_tensor = load_image_tensor(img_bytes)
+    # 檢測是否為卡通風格書籍
+    is_cartoon = detect_cartoon_book_simple(pil_img if pil_img is not None else img_tensor)
+    return preprocess_images(img_tensor), is_cartoon
+
+def compute_rotation_scores(cos: np.ndarray, q_norms: np.ndarray, d_norms: np.ndarray,
+                            is_cartoon: bool) -> np.ndarray:
+    """
+    由 (角度數, 欄數) 餘弦相似度與兩端原始範數計算最終比對分數
+    d_norms 為 (欄數,)，或各角度候選欄位不同時與 cos 同形狀
+    """
+    if not is_cartoon:
+        return cos
+
+    # 卡通書: 融合餘弦相似度與歐幾里得距離補償 (距離以原始 CLIP 特徵尺度計算，與閾值調校時一致)
+    # ||q - d||² = ||q||² + ||d||² - 2·||q||·||d||·cos(q, d)，直接沿用已算好的內積；
+    # 書籍範數未記錄 (NaN) 時以查詢範數代替，距離維持在同一尺度
+    q = q_norms.astype(np.float32)[:, None]
+    d = np.where(np.isnan(d_norms), q, d_norms)
+    # 累加在 scores 緩衝區原地進行；d、q * q、d * d 與 0.7 * cos 仍各自配置暫存陣列
+    scores = np.multiply(cos, -2.0)
+    scores *= q
+    scores *= d
+    scores += q * q
+    scores += d * d
+    np.maximum(scores, 0.0, out=scores)
+    np.sqrt(scores, out=scores)             # 歐幾里得距離
+    scores += 1.0
+    np.divide(0.3, scores, out=scores)      # 0.3 * 歐幾里得相似度
+    scores += 0.7 * cos
+    return scores
+
+def top_two_scores(scores: np.ndarray) -> Tuple[int, int, float, float]:
+    """回傳 (角度索引, 欄索引, 最高分, 第二高分)；只有一個元素時第二高分為 -inf"""
+    angle_idx, col_idx = np.unravel_index(int(scores.argmax()), scores.shape)
+    flat_scores = scores.ravel()
+    second_max = float(np.partition(flat_scores, -2)[-2]) if flat_scores.size > 1 else -np.inf
+    return int(angle_idx), int(col_idx), float(scores[angle_idx, col_idx]), second_max
+
+def rank_cartoon_top_k(cos: np.ndarray, q_norms: np.ndarray,
+                       d_norms: np.ndarray) -> Optional[Tuple[int, int, float, float]]:
+    """
+    只對每個角度餘弦相似度前 CARTOON_TOP_K 名計算卡通書融合分數
+    回傳 (角度索引, 書籍索引, 最高分, 第二高分)；無法保證前兩名正確時回傳 None
+    """
+    top_idx = np.argpartition(-cos, CARTOON_TOP_K - 1, axis=1)[:, :CARTOON_TOP_K]  # (角度數, K)
+    top_cos = np.take_along_axis(cos, top_idx, axis=1)
+    fused = compute_rotation_scores(top_cos, q_norms, d_norms[top_idx], True)
+    angle_idx, k, max_score, second_max = top_two_scores(fused)
+
+    # 未入選書籍的餘弦相似度不超過該角度第 K 名 c；c ≥ 0 時對任意書籍範數
+    # 歐幾里得距離 ≥ ||q||·sqrt(1 - c²) (c < 0 時 ≥ ||q||)，因此其融合分數不超過
+    # 0.7·c + 0.3 / (1 + ||q||·sqrt(1 - max(c, 0)²))；上限仍可能超過第二高分時改算完整矩陣
+    cos_k = top_cos.min(axis=1).astype(np.float64)
+    min_dist = q_norms.astype(np.float64) * np.sqrt(1.0 - np.clip(cos_k, 0.0, 1.0) ** 2)
+    bound = 0.7 * cos_k + 0.3 / (1.0 + min_dist)
+    if bound.max() > second_max:
+        return None
+    return angle_idx, int(top_idx[angle_idx, k]), max_score, second_max
+
+def rank_scores(cos: np.ndarray, q_norms: np.ndarray, d_norms: np.ndarray,
+                is_cartoon: bool) -> Tuple[int, int, float, float]:
+    """
+    由 (角度數, 書籍數) 的餘弦相似度矩陣取出最佳匹配
+    回傳 (角度索引, 書籍索引, 最高分, 與第二高分的差距)
+    """
+    # 一般書籍的分數即餘弦相似度；卡通書的距離項依各書籍範數而異，
+    # 先只對餘弦相似度前 K 名計算融合分數，無法證明結果正確時才計算完整分數矩陣
+    ranked = None
+    if is_cartoon and 0 < CARTOON_TOP_K < cos.shape[1]:
+        ranked = rank_cartoon_top_k(cos, q_norms, d_norms)
+    if ranked is None:
+        ranked = top_two_scores(compute_rotation_scores(cos, q_norms, d_norms, is_cartoon))
+    angle_idx, db_idx, max_score, second_max = ranked
+    if not np.isfinite(second_max):
+        # 只有單一候選 (pgvector 未命中的位置為 -inf)
+        second_max = 0
+    return angle_idx, db_idx, max_score, max_score - second_max
+
+async def score_query_embeddings(pool, query_embs: np.ndarray, db_ids: np.ndarray,
+                                 db_unit: Optional[np.ndarray], db_norms: np.ndarray):
+    """
+    計算查詢向量與資料庫書籍的餘弦相似度，回傳 (書籍 ID, (角度數, 書籍數) 相似度矩陣, 書籍原始範數)
+    db_unit 為 None 時改由 pgvector 搜尋候選書籍
+    """
+    if db_unit is None:
+        async with pool.acquire() as conn:
+            db_ids, cos, db_norms = await search_pgvector(conn, query_embs)
+        logger.info(f"🧭 pgvector 候選書籍: {len(db_ids)} 本")
+    else:
+        # 一次矩陣乘法計算 (角度數, N) 的餘弦相似度
+        cos = query_embs @ db_unit.T
+    return db_ids, cos, db_norms
+
 async def save_book_with_rotation_enhanced(
     title: str,
     isbn: str,
     url: str,
-    image_file: Any
+    img_bytes: bytes
 ) -> Tuple[bool, str]:
     """
-    管理流程：建表 → 儲存 metadata → 計算 CLIP embedding → 寫入向量 - PostgreSQL版本
+    管理流程：計算 CLIP embedding → 儲存封面 → 一次寫入 metadata 與向量 - PostgreSQL版本
     """
-    conn = None
+    cover_path = ""
     try:
         # 檢查 CLIP 模型是否可用
         if _clip_model is None or _clip_processor is None:
             return False, "CLIP 模型未正確初始化"
         
-        # 1) 確保表存在
-        ensure_table()
+        # 1) 表格於啟動時已檢查；僅在啟動檢查失敗時補做
+        if not _tables_ready:
+            await ensure_table()
         
-        # 2) 讀取圖片資料
-        if hasattr(image_file, 'read'):
-            if asyncio.iscoroutinefunction(image_file.read):
-                img_bytes = await image_file.read()
-            else:
-                img_bytes = image_file.read()
-        elif isinstance(image_file, str):
-            # 處理 base64 字串
-            if image_file.startswith("data:") and "," in image_file:
-                _, b64 = image_file.split(",", 1)
-            else:
-                b64 = image_file
-            img_bytes = base64.b64decode(b64)
-        else:
+        # 2) 檢查圖片資料
+        if not img_bytes:
             return False, "無效的圖片資料"
 
-        # 3) 儲存書本 metadata - PostgreSQL版本
-        logger.info(f"📝 使用PostgreSQL資料庫")
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        # 插入時明確設定 created_at
-        cursor.execute("""
-            INSERT INTO books(title, isbn, url, cover_path, created_at) 
-            VALUES(%s, %s, %s, %s, NOW()) 
-            RETURNING id
-        """, (title, isbn, url, ""))
-        
-        book_id = cursor.fetchone()[0]
-        logger.info(f"📚 新增書籍 ID: {book_id}, 標題: {title}")
-        
-        # 4) 儲存圖片檔案
-        cover_path = save_uploaded_image(img_bytes, book_id)
+        # 3) 先計算向量 - CLIP 推論期間不占用資料庫連線；解碼與前處理在執行緒中完成
+        pixel_values = await asyncio.to_thread(preprocess_image_bytes, img_bytes)
+        # 單位化後以 float16 儲存 (體積減半，餘弦相似度不受影響)，原始範數另存於 vector_norm
+        unit, norms = split_norms(await embed_pixel_values(pixel_values))
+        emb, emb_norm = unit[0].astype(np.float16), float(norms[0])
+
+        # 4) 儲存圖片檔案 (檔名不需書籍 ID，INSERT 時即可帶入最終路徑)
+        cover_path = await save_uploaded_image(img_bytes)
         if cover_path:
-            cursor.execute(
-                "UPDATE books SET cover_path = %s WHERE id = %s",
-                (cover_path, book_id)
-            )
             logger.info(f"🖼️ 圖片已儲存: {cover_path}")
 
-        # 5) 計算向量
-        pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        inputs = _clip_processor(images=pil_img, return_tensors="pt")
-        with torch.no_grad():
-            emb = _clip_model.get_image_features(**inputs).numpy().flatten()
+        # 5) 書本 metadata、向量與版本號以單一語句寫入 (一次往返，語句本身即為原子操作)
+        logger.info(f"📝 使用PostgreSQL資料庫")
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            if _pgvector_available:
+                row = await conn.fetchrow(INSERT_BOOK_WITH_EMBEDDING_PGVECTOR_SQL,
+                                          title, isbn, url, cover_path,
+                                          emb.tobytes(), EMBEDDING_FORMAT_VERSION, emb_norm, to_pgvector(emb))
+            else:
+                row = await conn.fetchrow(INSERT_BOOK_WITH_EMBEDDING_SQL,
+                                          title, isbn, url, cover_path,
+                                          emb.tobytes(), EMBEDDING_FORMAT_VERSION, emb_norm)
+        book_id, new_version = row['id'], row['version']
 
-        # 6) 寫入 cover_embeddings - PostgreSQL使用BYTEA
-        cursor.execute("""
-            INSERT INTO cover_embeddings(book_id, vector) 
-            VALUES(%s, %s) 
-            ON CONFLICT (book_id) 
-            DO UPDATE SET vector = EXCLUDED.vector
-        """, (book_id, emb.tobytes()))
-        
+        logger.info(f"📚 新增書籍 ID: {book_id}, 標題: {title}")
         logger.info(f"🧠 向量已儲存，維度: {len(emb)}")
 
-        # 7) 提交並關閉
-        conn.commit()
+        # 6) 已提交，同步更新快取
+        cache_add_embedding(book_id, emb, emb_norm, new_version)
         return True, f"書籍與向量已建立 (ID: {book_id})"
         
     except Exception as e:
-        logger.error(f"❌ 儲存書籍失敗: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
-        if conn:
-            conn.rollback()
+        log_exception("❌ 儲存書籍失敗", e)
+        # 資料庫未寫入成功 (交易已回滾) 時移除已儲存的封面檔
+        if cover_path and os.path.exists(cover_path):
+            os.remove(cover_path)
         return False, f"儲存失敗: {str(e)}"
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
-async def identify_book_with_rotation_enhanced(image_file):
+async def save_books_bulk_enhanced(
+    books: List[Tuple[str, str, str, bytes]]
+) -> Tuple[bool, str, List[int]]:
+    """
+    批次新增書籍：所有封面一次批次計算 CLIP embedding，再以單一 UNNEST 語句寫入
+    books 為 (書名, ISBN, 網址, 圖片位元組) 列表；任一筆失敗則全部不寫入
+    """
+    cover_paths = []
+    try:
+        if _clip_model is None or _clip_processor is None:
+            return False, "CLIP 模型未正確初始化", []
+        
+        if not _tables_ready:
+            await ensure_table()
+        
+        if not books:
+            return False, "沒有要新增的書籍", []
+        if any(not img_bytes for _, _, _, img_bytes in books):
+            return False, "無效的圖片資料", []
+
+        # 1) 封面在執行緒中各自解碼與前處理，再交給推論工作者 (超過單批上限時自動切塊)
+        pixel_values = torch.cat(await asyncio.gather(
+            *(asyncio.to_thread(preprocess_image_bytes, img_bytes) for _, _, _, img_bytes in books)
+        ))
+        unit, emb_norms = split_norms(await embed_pixel_values(pixel_values))
+        embs = unit.astype(np.float16)
+
+        # 2) 儲存圖片檔案
+        cover_paths = list(await asyncio.gather(*(save_uploaded_image(img_bytes) for _, _, _, img_bytes in books)))
+
+        # 3) 書籍、向量與版本號以單一語句寫入
+        args = [
+            [title for title, _, _, _ in books],
+            [isbn for _, isbn, _, _ in books],
+            [url for _, _, url, _ in books],
+            cover_paths,
+            [emb.tobytes() for emb in embs],
+            EMBEDDING_FORMAT_VERSION,
+            emb_norms.tolist()
+        ]
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            if _pgvector_available:
+                row = await conn.fetchrow(INSERT_BOOKS_BULK_PGVECTOR_SQL, *args, [to_pgvector(emb) for emb in embs])
+            else:
+                row = await conn.fetchrow(INSERT_BOOKS_BULK_SQL, *args)
+        book_ids, new_version = list(row['ids']), row['version']
+
+        logger.info(f"📚 批次新增 {len(book_ids)} 本書籍: ID {book_ids}")
+
+        # 4) 已提交，同步更新快取
+        cache_add_embeddings(book_ids, embs, emb_norms, new_version)
+        return True, f"已批次建立 {len(book_ids)} 本書籍與向量", book_ids
+        
+    except Exception as e:
+        log_exception("❌ 批次儲存書籍失敗", e)
+        # 資料庫未寫入成功時移除已儲存的封面檔
+        for cover_path in cover_paths:
+            if cover_path and os.path.exists(cover_path):
+                os.remove(cover_path)
+        return False, f"批次儲存失敗: {str(e)}", []
+
+async def identify_book_with_rotation_enhanced(img_bytes: bytes):
     """加入卡通書處理的識別函數 - PostgreSQL版本"""
-    conn = None
     try:
         # 檢查 CLIP 模型是否可用
         if _clip_model is None or _clip_processor is None:
             return {}, "CLIP 模型未正確初始化"
         
-        ensure_table()
+        if not _tables_ready:
+            await ensure_table()
 
-        # 讀取圖片
-        if hasattr(image_file, "read"):
-            read_fn = image_file.read
-            if asyncio.iscoroutinefunction(read_fn):
-                img_bytes = await read_fn()
-            else:
-                img_bytes = read_fn()
-        else:
-            return {}, "無效的檔案物件"
-
-        pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+        if not img_bytes:
+            return {}, "無效的圖片資料"
 
-        # 檢測是否為卡通風格書籍
-        is_cartoon = detect_cartoon_book_simple(pil_img)
-        
-        # 載入資料庫 - PostgreSQL版本
-        logger.info(f"🔍 從PostgreSQL載入向量")
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT book_id, vector FROM cover_embeddings")
-        rows = cursor.fetchall()
-        
-        db_items = []
-        for row in rows:
-            book_id = row['book_id']
-            vector_bytes = row['vector']
-            # PostgreSQL BYTEA 需要直接使用 bytes
-            if isinstance(vector_bytes, memoryview):
-                vector_bytes = vector_bytes.tobytes()
-            vector = np.frombuffer(vector_bytes, dtype=np.float32)
-            db_items.append((book_id, vector))
+        # 相同圖片 (重試、重複掃描) 直接取用快取的查詢特徵
+        cache_key = image_cache_key(img_bytes)
+        cached = query_cache_get(cache_key)
+        pixel_values = None
+        if cached is not None:
+            query_embs, query_norms, is_cartoon = cached
+            logger.info("⚡ 查詢向量快取命中")
+        else:
+            query_embs = None
+            # 解碼、卡通檢測與前處理都在執行緒中完成 (GPU 上的 .cpu() 會等待裝置同步，不能佔住事件迴圈)
+            pixel_values, is_cartoon = await asyncio.to_thread(analyze_query_image, img_bytes)
         
-        logger.info(f"📊 找到 {len(db_items)} 個向量記錄")
+        pool = await db_config.get_async_pool()
 
-        if not db_items:
-            return {}, "資料庫中沒有書籍記錄"
+        # 載入資料庫向量 - 使用 pgvector 時改由資料庫搜尋，否則使用記憶體快取
+        db_ids, db_unit, db_norms = np.array([], dtype=np.int64), None, np.array([], dtype=np.float32)
+        if not use_pgvector_search():
+            async with pool.acquire() as conn:
+                db_ids, db_unit, db_norms = await load_embeddings_if_stale(conn)
+            
+            logger.info(f"📊 找到 {len(db_ids)} 個向量記錄")
+
+            if len(db_ids) == 0:
+                return {}, "資料庫中沒有書籍記錄"
 
         # 根據書籍類型調整閾值
         if is_cartoon:
@@ -546,66 +1316,66 @@ async def identify_book_with_rotation_enhanced(image_file):
             LOW_CONFIDENCE_THRESHOLD = 0.55   # 降低5%
             MIN_GAP_REQUIRED = 0.08
 
-        # 四角度旋轉比對
-        best = {"book_id": None, "score": -1.0, "rotation": 0}
-        all_scores = []
-        
-        for angle in (0, 90, 180, 270):
-            rotated = pil_img.rotate(angle, expand=True)
-            inputs = _clip_processor(images=rotated, return_tensors="pt")
-            with torch.no_grad():
-                emb = _clip_model.get_image_features(**inputs).numpy().flatten()
-            
-            for book_id, db_emb in db_items:
-                # 針對卡通書籍使用改良的相似度計算
-                if is_cartoon:
-                    # 方法1: 標準餘弦相似度
-                    dot = float(np.dot(emb, db_emb))
-                    norm = float(np.linalg.norm(emb) * np.linalg.norm(db_emb))
-                    cosine_sim = dot / norm if norm else 0.0
-                    
-                    # 方法2: 歐幾里得距離補償
-                    euclidean_dist = float(np.linalg.norm(emb - db_emb))
-                    euclidean_sim = 1 / (1 + euclidean_dist)
-                    
-                    # 融合兩種方法
-                    score = 0.7 * cosine_sim + 0.3 * euclidean_sim
-                else:
-                    # 普通書籍使用標準餘弦相似度
-                    dot = float(np.dot(emb, db_emb))
-                    norm = float(np.linalg.norm(emb) * np.linalg.norm(db_emb))
-                    score = dot / norm if norm else 0.0
-                
-                all_scores.append(score)
-                
-                if score > best["score"]:
-                    best.update({"book_id": book_id, "score": score, "rotation": angle})
+        # 先只比對 0 度 (多數掃描為正放)；只前處理一次，其他角度直接旋轉 224×224 的 pixel_values
+        # (縮放與中心裁切對 90 度旋轉等變，結果等同先旋轉原圖再前處理)
+        cache_dirty = False
+        if query_embs is None:
+            query_embs, query_norms = split_norms(await embed_pixel_values(pixel_values))  # (1, D)，0 度
+            cache_dirty = True
+
+        db_ids, cos, db_norms = await score_query_embeddings(pool, query_embs, db_ids, db_unit, db_norms)
+        if len(db_ids) == 0:
+            return {}, "資料庫中沒有書籍記錄"
+        angle_idx, db_idx, max_score, score_gap = rank_scores(cos, query_norms, db_norms, is_cartoon)
+
+        early_exit = (len(query_embs) == 1 and max_score >= HIGH_CONFIDENCE_THRESHOLD
+                      and score_gap >= MIN_GAP_REQUIRED)
+        if len(query_embs) < len(ROTATION_ANGLES) and not early_exit:
+            # 0 度不夠明確 - 其餘三個角度一次批次送入 CLIP (逆時針，等同 PIL rotate(expand=True))
+            if pixel_values is None:
+                # 快取中只有 0 度特徵，重新解碼取得 pixel_values
+                pixel_values = await asyncio.to_thread(preprocess_image_bytes, img_bytes)
+            rotated = torch.cat([torch.rot90(pixel_values, angle // 90, dims=(-2, -1)) for angle in ROTATION_ANGLES[1:]], dim=0)
+            rotated_embs, rotated_norms = split_norms(await embed_pixel_values(rotated))
+            query_embs = np.concatenate([query_embs, rotated_embs])  # (4, D)
+            query_norms = np.concatenate([query_norms, rotated_norms])
+            cache_dirty = True
+
+            db_ids, cos, db_norms = await score_query_embeddings(pool, query_embs, db_ids, db_unit, db_norms)
+            angle_idx, db_idx, max_score, score_gap = rank_scores(cos, query_norms, db_norms, is_cartoon)
+
+        if cache_dirty:
+            query_cache_put(cache_key, query_embs, query_norms, is_cartoon)
+
+        _rotation_stats["early_exit" if len(query_embs) == 1 else "full"] += 1
+        total_rotation = _rotation_stats["early_exit"] + _rotation_stats["full"]
+        logger.info(f"🔄 比對角度數: {len(query_embs)}，0 度提前結束比例: "
+                    f"{_rotation_stats['early_exit'] / total_rotation:.1%} ({_rotation_stats['early_exit']}/{total_rotation})")
+
+        best = {
+            "book_id": int(db_ids[db_idx]),
+            "score": max_score,
+            "rotation": ROTATION_ANGLES[angle_idx]
+        }
 
         logger.info(f"🎯 最佳匹配: ID={best['book_id']}, 分數={best['score']:.3f}, 角度={best['rotation']}°")
 
         # 分析分數分布
-        if all_scores:
-            max_score = max(all_scores)
-            second_max = sorted(all_scores, reverse=True)[1] if len(all_scores) > 1 else 0
-            score_gap = max_score - second_max
-            
-            logger.info(f"📊 分數分析: 最高={max_score:.3f}, 第二高={second_max:.3f}, 差距={score_gap:.3f}")
-            logger.info(f"🔍 需要差距: {MIN_GAP_REQUIRED:.3f}, 卡通書: {is_cartoon}")
+        logger.info(f"📊 分數分析: 最高={max_score:.3f}, 第二高={max_score - score_gap:.3f}, 差距={score_gap:.3f}")
+        logger.info(f"🔍 需要差距: {MIN_GAP_REQUIRED:.3f}, 卡通書: {is_cartoon}")
 
-            # 智能判斷邏輯
-            if best["book_id"] and best["score"] >= HIGH_CONFIDENCE_THRESHOLD and score_gap >= MIN_GAP_REQUIRED:
-                result_type = "high_confidence"
-                
-            elif best["book_id"] and best["score"] >= LOW_CONFIDENCE_THRESHOLD and score_gap >= MIN_GAP_REQUIRED:
-                result_type = "medium_confidence"
-                
-            elif best["book_id"] and best["score"] >= LOW_CONFIDENCE_THRESHOLD:
-                # 分數差距不足時標記為不確定
-                result_type = "low_confidence_similar"
-                logger.info(f"⚠️ 分數差距不足 ({score_gap:.3f} < {MIN_GAP_REQUIRED:.3f})，標記為不確定匹配")
-                
-            else:
-                result_type = "unknown_book"
+        # 智能判斷邏輯
+        if best["book_id"] and best["score"] >= HIGH_CONFIDENCE_THRESHOLD and score_gap >= MIN_GAP_REQUIRED:
+            result_type = "high_confidence"
+            
+        elif best["book_id"] and best["score"] >= LOW_CONFIDENCE_THRESHOLD and score_gap >= MIN_GAP_REQUIRED:
+            result_type = "medium_confidence"
+            
+        elif best["book_id"] and best["score"] >= LOW_CONFIDENCE_THRESHOLD:
+            # 分數差距不足時標記為不確定
+            result_type = "low_confidence_similar"
+            logger.info(f"⚠️ 分數差距不足 ({score_gap:.3f} < {MIN_GAP_REQUIRED:.3f})，標記為不確定匹配")
+            
         else:
             result_type = "unknown_book"
 
@@ -622,8 +1392,8 @@ async def identify_book_with_rotation_enhanced(image_file):
 
         elif result_type == "low_confidence_similar":
             # 對不確定的匹配要求用戶確認
-            cursor.execute("SELECT title, isbn, url FROM books WHERE id = %s", (best["book_id"],))
-            row = cursor.fetchone()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(GET_BOOK_INFO_SQL, best["book_id"])
             
             if row:
                 return {
@@ -640,7 +1410,7 @@ async def identify_book_with_rotation_enhanced(image_file):
                     "details": {
                         "confidence_level": "低",
                         "processing_type": "FastAPI Enhanced",
-                        "score_gap": round(score_gap * 100, 2) if 'score_gap' in locals() else 0,
+                        "score_gap": round(score_gap * 100, 2),
                         "cartoon_detected": is_cartoon,
                         "gap_required": round(MIN_GAP_REQUIRED * 100, 2)
                     }
@@ -648,8 +1418,8 @@ async def identify_book_with_rotation_enhanced(image_file):
 
         else:
             # 正常的高/中信心識別
-            cursor.execute("SELECT title, isbn, url FROM books WHERE id = %s", (best["book_id"],))
-            row = cursor.fetchone()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(GET_BOOK_INFO_SQL, best["book_id"])
             
             if row:
                 result = {
@@ -663,7 +1433,7 @@ async def identify_book_with_rotation_enhanced(image_file):
                     "details": {
                         "confidence_level": "高" if result_type == "high_confidence" else "中",
                         "processing_type": "FastAPI Enhanced",
-                        "score_gap": round(score_gap * 100, 2) if 'score_gap' in locals() else 0,
+                        "score_gap": round(score_gap * 100, 2),
                         "cartoon_detected": is_cartoon
                     }
                 }
@@ -673,12 +1443,8 @@ async def identify_book_with_rotation_enhanced(image_file):
         return {}, "未找到匹配的書籍"
         
     except Exception as e:
-        logger.error(f"❌ 識別失敗: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
+        log_exception("❌ 識別失敗", e)
         return {}, f"識別過程發生錯誤: {str(e)}"
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 def check_enhanced_clip_status() -> str:
     try:
@@ -691,29 +1457,39 @@ def check_enhanced_clip_status() -> str:
     except Exception:
         return "load_failed"
 
-def convert_numpy_types(obj):
-    """
-    完整轉換所有 numpy 類型為 Python 原生類型
-    """
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.bool_):  # 🔥 關鍵：處理 numpy.bool
-        return bool(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {k: convert_numpy_types(v) for k, v in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [convert_numpy_types(v) for v in obj]
-    elif hasattr(obj, 'item'):  # torch 張量等
-        try:
-            return obj.item()
-        except:
-            return str(obj)
-    else:
-        return obj
+def make_etag(*parts) -> str:
+    """由任意可轉為字串的值產生 ETag (含引號)"""
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """檢查 If-None-Match 是否包含目前的 ETag (忽略弱比對前綴 W/)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+# 封面預設圖 (無封面) 與載入失敗圖，於載入時預先建立
+_DEFAULT_SVG_TEMPLATE = '''<svg width="80" height="110" xmlns="http://www.w3.org/2000/svg">
+            <rect width="80" height="110" fill="#f0f0f0" stroke="#ccc" stroke-width="2" rx="5"/>
+            <text x="40" y="25" text-anchor="middle" font-family="Arial" font-size="10" fill="#666">📖</text>
+            <text x="40" y="45" text-anchor="middle" font-family="Arial" font-size="8" fill="#333">{safe_title}</text>
+            <text x="40" y="60" text-anchor="middle" font-family="Arial" font-size="6" fill="#999">ID: {book_id}</text>
+            <text x="40" y="75" text-anchor="middle" font-family="Arial" font-size="6" fill="#ccc">無封面圖片</text>
+        </svg>'''
+
+_ERROR_SVG_BYTES = '''<svg width="80" height="110" xmlns="http://www.w3.org/2000/svg">
+            <rect width="80" height="110" fill="#ffe6e6" stroke="#ff9999" stroke-width="2" rx="5"/>
+            <text x="40" y="30" text-anchor="middle" font-family="Arial" font-size="12" fill="#cc0000">❌</text>
+            <text x="40" y="50" text-anchor="middle" font-family="Arial" font-size="8" fill="#cc0000">載入失敗</text>
+        </svg>'''.encode()
+
+@functools.lru_cache(maxsize=1024)
+def render_default_cover_svg(safe_title: str, book_id: int) -> Tuple[bytes, str]:
+    """產生 (並快取) 無封面書籍的預設 SVG，回傳 (內容, ETag)"""
+    svg_bytes = _DEFAULT_SVG_TEMPLATE.format(safe_title=html.escape(safe_title), book_id=book_id).encode()
+    return svg_bytes, make_etag(hashlib.blake2b(svg_bytes, digest_size=16).hexdigest())
 
 # ===== HTML路由 =====
 @app.get("/", response_class=HTMLResponse)
@@ -771,11 +1547,20 @@ async def api_save_book(book_data: BookModel):
                 message="圖片資料不能為空"
             )
         
+        try:
+            image_bytes = decode_base64_image(book_data.image)
+        except Exception as e:
+            logger.error(f"Base64 解碼失敗: {e}")
+            return ApiResponse(
+                success=False,
+                message=f"圖片格式錯誤: {str(e)}"
+            )
+        
         success, message = await save_book_with_rotation_enhanced(
             book_data.title.strip(),
             book_data.isbn.strip() if book_data.isbn else "",
             book_data.url.strip() if book_data.url else "",
-            book_data.image
+            image_bytes
         )
         
         if success:
@@ -789,8 +1574,7 @@ async def api_save_book(book_data: BookModel):
         )
         
     except Exception as e:
-        logger.error(f"儲存書籍異常: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
+        log_exception("儲存書籍異常", e)
         return ApiResponse(
             success=False,
             message=f"FastAPI儲存錯誤: {str(e)}"
@@ -835,14 +1619,11 @@ async def api_save_book_file(
                 message=f"檔案過大: {len(content) / 1024 / 1024:.1f}MB (限制: 10MB)"
             )
         
-        # 重置檔案指針
-        await image.seek(0)
-        
         success, message = await save_book_with_rotation_enhanced(
             title.strip(),
             isbn.strip(),
             url.strip(),
-            image
+            content
         )
         
         if success:
@@ -856,8 +1637,7 @@ async def api_save_book_file(
         )
         
     except Exception as e:
-        logger.error(f"儲存書籍檔案異常: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
+        log_exception("儲存書籍檔案異常", e)
         return ApiResponse(
             success=False,
             message=f"FastAPI檔案儲存錯誤: {str(e)}"
@@ -872,45 +1652,30 @@ async def api_identify_book(book_data: BookModel):
         if not book_data.image:
             return {"success": False, "message": "圖片資料不能為空"}
         
-        image_str = book_data.image
-        if image_str.startswith("data:") and "," in image_str:
-            _, b64data = image_str.split(",", 1)
-        else:
-            b64data = image_str
-
         try:
-            image_bytes = base64.b64decode(b64data)
-            if len(image_bytes) == 0:
-                raise ValueError("Base64 解碼後圖片為空")
+            image_bytes = decode_base64_image(book_data.image)
         except Exception as e:
             logger.error(f"Base64 解碼失敗: {e}")
             return {"success": False, "message": f"圖片格式錯誤: {str(e)}"}
 
-        fake_file = io.BytesIO(image_bytes)
-        fake_file.name = "upload.png"
-        fake_file.seek(0)
-
         # 呼叫識別函數
-        result, error = await identify_book_with_rotation_enhanced(fake_file)
+        result, error = await identify_book_with_rotation_enhanced(image_bytes)
 
         if result:
             logger.info(f"識別成功: {result.get('title', 'Unknown')}")
             
-            # 完全轉換所有類型
-            clean_result = convert_numpy_types(result)
-            
-            return {
+            # 結果皆為 Python 原生型別，直接以 orjson 序列化 (略過 FastAPI 的 jsonable_encoder 遞迴轉換)
+            return ORJSONResponse(content={
                 "success": True,
-                "book": clean_result,
+                "book": result,
                 "message": "識別成功"
-            }
+            })
         else:
             logger.warning(f"識別失敗: {error}")
             return {"success": False, "message": error or "未找到匹配的書籍"}
             
     except Exception as e:
-        logger.error(f"識別過程異常: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
+        log_exception("識別過程異常", e)
         return {"success": False, "message": f"FastAPI 處理錯誤: {str(e)}"}
 
 @app.post("/api/identify_book_file")
@@ -931,128 +1696,133 @@ async def api_identify_book_file(image: UploadFile = File(...)):
         if file_size == 0:
             return {"success": False, "message": "上傳的檔案為空"}
         
-        await image.seek(0)
-        
         # 呼叫識別函數
-        result, error = await identify_book_with_rotation_enhanced(image)
+        result, error = await identify_book_with_rotation_enhanced(content)
 
         if result:
             logger.info(f"識別成功: {result.get('title', 'Unknown')}")
             
-            # 完全轉換所有類型
-            clean_result = convert_numpy_types(result)
-            
-            return {
+            # 結果皆為 Python 原生型別，直接以 orjson 序列化 (略過 FastAPI 的 jsonable_encoder 遞迴轉換)
+            return ORJSONResponse(content={
                 "success": True,
-                "book": clean_result,
+                "book": result,
                 "message": "識別成功"
-            }
+            })
         else:
             logger.warning(f"識別失敗: {error}")
             return {"success": False, "message": error or "未找到匹配的書籍"}
             
     except Exception as e:
-        logger.error(f"檔案識別過程異常: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
+        log_exception("檔案識別過程異常", e)
         return {"success": False, "message": f"FastAPI 檔案處理錯誤: {str(e)}"}
 
+# /api/books 分頁查詢: keyset 分頁以主鍵 id 範圍掃描取代 OFFSET，任何頁數的成本都相同；
+# cover_embeddings.book_id 為主鍵，JOIN 直接使用主鍵索引
+# 第一頁與後續頁分成兩個語句: 若寫成 "$1 IS NULL OR id < $1"，prepared statement 改用通用計畫後
+# id 條件無法作為索引條件，每頁都要從最新一筆掃描過去
+_LIST_BOOKS_SELECT = """
+    SELECT b.id, b.title,
+           COALESCE(b.isbn, '') AS isbn,
+           COALESCE(b.url, '') AS url,
+           COALESCE(b.cover_path, '') AS cover_path,
+           b.created_at,
+           (ce.book_id IS NOT NULL) AS has_clip,
+           'FastAPI Enhanced (PostgreSQL)' AS tech_type
+    FROM books b
+    LEFT JOIN cover_embeddings ce ON ce.book_id = b.id
+"""
+LIST_BOOKS_FIRST_PAGE_SQL = _LIST_BOOKS_SELECT + """
+    ORDER BY b.id DESC
+    LIMIT $1
+"""
+LIST_BOOKS_BEFORE_ID_SQL = _LIST_BOOKS_SELECT + """
+    WHERE b.id < $2
+    ORDER BY b.id DESC
+    LIMIT $1
+"""
+
 @app.get("/api/books")
-async def api_books():
-    """取得所有書籍記錄 - PostgreSQL版本"""
-    conn = None
+async def api_books(
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000),
+    before_id: Optional[int] = Query(None, ge=1)
+):
+    """取得書籍記錄 (依 ID 由新到舊分頁，下一頁以回傳的 next_before_id 查詢) - PostgreSQL版本"""
     try:
         logger.info("📡 FastAPI PostgreSQL /api/books 被呼叫")
         
-        ensure_table()
-        
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        # 檢查表格結構
-        cursor.execute("""
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_schema = 'public' 
-            AND table_name = 'books'
-            ORDER BY ordinal_position;
-        """)
-        columns_info = cursor.fetchall()
-        column_names = [col['column_name'] for col in columns_info]
-        logger.info(f"📋 books 表格欄位: {column_names}")
-        
-        # 查詢所有書籍
-        cursor.execute("""
-            SELECT id, title, isbn, url, cover_path, created_at 
-            FROM books 
-            ORDER BY id DESC
-        """)
-        books_data = cursor.fetchall()
-        
-        logger.info(f"📊 資料庫查詢結果: {len(books_data)} 筆記錄")
+        # 表格於啟動時已檢查 (同時快取欄位清單)；僅在啟動檢查失敗時補做
+        if not _tables_ready:
+            await ensure_table()
+        
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            # 新增/批次新增/刪除書籍都會在同一交易中遞增 embedding_meta 版本號，
+            # 以版本號 (單筆主鍵查詢) 加上分頁參數產生 ETag；資料未變動時回傳 304，不查詢也不序列化書籍列表
+            embedding_version = await conn.fetchval("SELECT version FROM embedding_meta WHERE id = 1")
+            etag = make_etag(embedding_version, limit, before_id, *_books_columns)
+            if etag_matches(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+
+            # 查詢書籍並一併取得是否已有 CLIP 向量；回傳欄位直接在 SQL 中整理好
+            if before_id is None:
+                books_data = await conn.fetch(LIST_BOOKS_FIRST_PAGE_SQL, limit)
+            else:
+                books_data = await conn.fetch(LIST_BOOKS_BEFORE_ID_SQL, limit, before_id)
         
-        books = []
-        for i, book in enumerate(books_data):
-            book_data = {
-                'id': book['id'],
-                'title': book['title'],
-                'isbn': book['isbn'] or '',
-                'url': book['url'] or '',
-                'cover_path': book['cover_path'] or '',
-                'created_at': book['created_at'].isoformat() if book['created_at'] else None,
-                'has_clip': True,
-                'tech_type': 'FastAPI Enhanced (PostgreSQL)'
-            }
-            books.append(book_data)
-            if i < 3:
-                logger.info(f"   📖 書籍 {i+1}: ID={book_data['id']}, 標題='{book_data['title']}', 封面='{book_data['cover_path'] or '無'}'")
+        # asyncpg Record 直接轉 dict，datetime 交由 orjson 原生序列化
+        books: List[BookRecord] = [dict(book) for book in books_data]
         
         logger.info(f"📊 FastAPI PostgreSQL總共回傳 {len(books)} 本書籍")
         
-        return {
+        page: BooksPage = {
             'success': True,
             'data': books,
             'total': len(books),
+            'next_before_id': books[-1]['id'] if len(books) == limit else None,
             'system': 'FastAPI v3.1 (PostgreSQL)',
             'database': f"PostgreSQL - {db_config.database}",
-            'table_columns': column_names
+            'table_columns': _books_columns
         }
+        return ORJSONResponse(content=page, headers={"ETag": etag})
         
     except Exception as e:
-        logger.error(f"❌ FastAPI PostgreSQL /api/books 錯誤: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
+        log_exception("❌ FastAPI PostgreSQL /api/books 錯誤", e)
         return {
             'success': False, 
             'message': f'FastAPI PostgreSQL載入失敗: {str(e)}',
             'error_type': type(e).__name__
         }
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 @app.delete("/api/books/{book_id}")
 async def api_delete_book(book_id: int):
     """刪除書籍記錄 - PostgreSQL版本"""
-    conn = None
     try:
         logger.info(f"🗑️ 刪除書籍 ID: {book_id}")
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        # 取得書籍資訊以刪除檔案
-        cursor.execute('SELECT cover_path FROM books WHERE id = %s', (book_id,))
-        book = cursor.fetchone()
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # 從資料庫刪除記錄並取回封面路徑 (CASCADE 會自動刪除 cover_embeddings)
+                # 以 fetchrow 區分「沒有這筆書籍」與「封面路徑為 NULL」；沒有刪到任何列時不遞增版本號，
+                # 避免各進程的向量快取與 /api/books 的 ETag 無故失效
+                deleted = await conn.fetchrow(DELETE_BOOK_SQL, book_id)
+                if deleted is not None:
+                    new_version = await bump_embedding_version(conn)
+        
+        if deleted is None:
+            logger.info(f"ℹ️ 書籍 ID {book_id} 不存在，無需刪除")
+        else:
+            cache_remove_embedding(book_id, new_version)
         
-        if book and book['cover_path'] and os.path.exists(book['cover_path']):
+        # 交易提交後才刪除檔案，避免回滾時封面已遺失
+        cover_path = deleted['cover_path'] if deleted is not None else None
+        if cover_path and os.path.exists(cover_path):
             try:
-                os.remove(book['cover_path'])
-                logger.info(f"✅ 已刪除檔案: {book['cover_path']}")
+                os.remove(cover_path)
+                logger.info(f"✅ 已刪除檔案: {cover_path}")
             except Exception as e:
-                logger.warning(f"⚠️ 刪除檔案失敗: {book['cover_path']}, {e}")
+                logger.warning(f"⚠️ 刪除檔案失敗: {cover_path}, {e}")
         
-        # 從資料庫刪除記錄 (CASCADE 會自動刪除 cover_embeddings)
-        cursor.execute('DELETE FROM books WHERE id = %s', (book_id,))
-        
-        conn.commit()
         logger.info(f"✅ FastAPI PostgreSQL書籍 ID {book_id} 已刪除")
         
         return {
@@ -1061,28 +1831,19 @@ async def api_delete_book(book_id: int):
         }
         
     except Exception as e:
-        logger.error(f"❌ FastAPI PostgreSQL刪除書籍失敗: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
-        if conn:
-            conn.rollback()
+        log_exception("❌ FastAPI PostgreSQL刪除書籍失敗", e)
         return {
             'success': False, 
             'message': f'FastAPI PostgreSQL刪除失敗: {str(e)}'
         }
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 @app.get("/api/image/{book_id}")
-async def api_get_image(book_id: int):
+async def api_get_image(book_id: int, request: Request):
     """取得書籍封面圖片 - PostgreSQL版本"""
-    conn = None
     try:
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT title, cover_path FROM books WHERE id = %s", (book_id,))
-        result = cursor.fetchone()
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            result = await conn.fetchrow(GET_BOOK_COVER_SQL, book_id)
         
         if not result:
             logger.error(f"❌ 書籍 ID {book_id} 不存在於 PostgreSQL")
@@ -1091,50 +1852,60 @@ async def api_get_image(book_id: int):
         title, cover_path = result['title'], result['cover_path']
         logger.info(f"🖼️ 查詢書籍 {book_id} '{title}' 的圖片，路徑: {cover_path or '無'}")
         
-        if cover_path and os.path.exists(cover_path):
+        # 在執行緒中 stat 一次 (同時判斷檔案是否存在)，不阻塞事件迴圈
+        stat = None
+        if cover_path:
+            try:
+                stat = await asyncio.to_thread(os.stat, cover_path)
+            except FileNotFoundError:
+                stat = None
+
+        if stat is not None:
+            # 以檔案修改時間與大小產生 ETag；瀏覽器已有相同版本時回傳 304，不重送圖片
+            headers = {
+                "ETag": make_etag(book_id, stat.st_mtime_ns, stat.st_size),
+                "Cache-Control": "public, max-age=3600"
+            }
+            if etag_matches(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+
             logger.info(f"✅ 回傳圖片檔案: {cover_path}")
-            return FileResponse(cover_path, media_type='image/jpeg')
+            # 沿用已取得的 stat 結果；檔案內容由 Starlette 以 sendfile 傳送，並支援 Range 請求
+            return FileResponse(
+                cover_path,
+                media_type='image/jpeg',
+                headers=headers,
+                stat_result=stat,
+                filename=os.path.basename(cover_path),
+                content_disposition_type="inline"
+            )
         
-        # 回傳預設的 SVG
+        # 回傳預設的 SVG (內容只取決於書名與 ID，可由瀏覽器長期快取)
         logger.info(f"⚠️ 圖片不存在，回傳預設 SVG")
         safe_title = title[:10] + "..." if len(title) > 10 else title
-        default_svg = f'''<svg width="80" height="110" xmlns="http://www.w3.org/2000/svg">
-            <rect width="80" height="110" fill="#f0f0f0" stroke="#ccc" stroke-width="2" rx="5"/>
-            <text x="40" y="25" text-anchor="middle" font-family="Arial" font-size="10" fill="#666">📖</text>
-            <text x="40" y="45" text-anchor="middle" font-family="Arial" font-size="8" fill="#333">{safe_title}</text>
-            <text x="40" y="60" text-anchor="middle" font-family="Arial" font-size="6" fill="#999">ID: {book_id}</text>
-            <text x="40" y="75" text-anchor="middle" font-family="Arial" font-size="6" fill="#ccc">無封面圖片</text>
-        </svg>'''
+        svg_bytes, etag = render_default_cover_svg(safe_title, book_id)
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
         
-        return Response(content=default_svg, media_type="image/svg+xml")
+        return Response(content=svg_bytes, media_type="image/svg+xml", headers=headers)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ 取得圖片失敗: {e}")
-        logger.error(f"詳細錯誤: {traceback.format_exc()}")
-        error_svg = f'''<svg width="80" height="110" xmlns="http://www.w3.org/2000/svg">
-            <rect width="80" height="110" fill="#ffe6e6" stroke="#ff9999" stroke-width="2" rx="5"/>
-            <text x="40" y="30" text-anchor="middle" font-family="Arial" font-size="12" fill="#cc0000">❌</text>
-            <text x="40" y="50" text-anchor="middle" font-family="Arial" font-size="8" fill="#cc0000">載入失敗</text>
-            <text x="40" y="65" text-anchor="middle" font-family="Arial" font-size="6" fill="#cc0000">ID: {book_id}</text>
-        </svg>'''
-        
-        return Response(content=error_svg, media_type="image/svg+xml")
-    finally:
-        if conn:
-            db_config.return_connection(conn)
+        log_exception("❌ 取得圖片失敗", e)
+        # 暫時性錯誤，不讓瀏覽器快取
+        return Response(content=_ERROR_SVG_BYTES, media_type="image/svg+xml", headers={"Cache-Control": "no-store"})
 
 # ===== 系統監控API =====
-@app.get("/api/model_info", response_model=SystemStatus)
-async def api_model_info():
-    """取得系統模型信息"""
+def build_system_status() -> SystemStatus:
+    """建立系統模型狀態"""
     try:
         current_model_info = {
             'available': _clip_model is not None and _clip_processor is not None,
             'name': 'CLIP ViT-Large/14',
             'dimension': 768,
-            'device': 'CPU'
+            'device': _device.upper()
         }
         
         enhancement_features = [
@@ -1156,7 +1927,7 @@ async def api_model_info():
             clip_status=clip_status,
             enhanced_clip_model=True,
             rotation_support=True,
-            device="CPU",
+            device=_device.upper(),
             model_name="CLIP ViT-Large/14",
             enhancement_features=enhancement_features,
             current_model=current_model_info,
@@ -1177,31 +1948,58 @@ async def api_model_info():
             compatibility_status='model_changed'
         )
 
+# 系統狀態快照: 模型只在啟動時載入，狀態於載入/預熱後建立一次並預先序列化
+# ETag 由快照內容雜湊而來，內容相同才會命中 304
+_STATUS_SNAPSHOT: Optional[bytes] = None
+_STATUS_ETAG = ""
+
+def refresh_status_snapshot():
+    """重建系統狀態快照 (模型載入或重新載入後呼叫)"""
+    global _STATUS_SNAPSHOT, _STATUS_ETAG
+    _STATUS_SNAPSHOT = orjson.dumps(build_system_status().model_dump())
+    # ETag 由快照內容產生: 重新部署或不同 worker 的狀態不同時標籤也不同
+    _STATUS_ETAG = make_etag(_STATUS_SNAPSHOT)
+
+@app.get("/api/model_info", response_model=SystemStatus)
+async def api_model_info():
+    """取得系統模型信息"""
+    return build_system_status()
+
 @app.get("/api/status", response_model=SystemStatus)
-async def api_status():
-    """取得系統狀態"""
-    return await api_model_info()
+async def api_status(request: Request):
+    """取得系統狀態 (回傳快取的快照)"""
+    if _STATUS_SNAPSHOT is None:
+        refresh_status_snapshot()
+    if etag_matches(request, _STATUS_ETAG):
+        return Response(status_code=304, headers={"ETag": _STATUS_ETAG})
+    return Response(content=_STATUS_SNAPSHOT, media_type="application/json", headers={"ETag": _STATUS_ETAG})
 
 @app.get("/api/health")
 async def api_health():
     """API 健康檢查"""
-    conn = None
     try:
-        ensure_table()
-        
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM books")
-        book_count = cursor.fetchone()[0]
+        # 表格於啟動時已檢查；僅在啟動檢查失敗時補做
+        if not _tables_ready:
+            await ensure_table()
+        
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            # 使用統計資訊中的估計筆數 (O(1))，不對整張表做 COUNT(*)；
+            # 從未 ANALYZE 的表格為 -1，此時表格通常很小，直接計數
+            book_count = await conn.fetchval("SELECT reltuples::bigint FROM pg_class WHERE oid = 'books'::regclass")
+            book_count_estimated = book_count is not None and book_count >= 0
+            if not book_count_estimated:
+                book_count = await conn.fetchval("SELECT COUNT(*) FROM books")
         
         clip_status = check_enhanced_clip_status()
         
-        return {
+        health: HealthStatus = {
             "success": True,
             "status": "healthy",
             "database": {
                 "connected": True,
                 "book_count": book_count,
+                "book_count_estimated": book_count_estimated,
                 "type": "PostgreSQL",
                 "host": db_config.host,
                 "database": db_config.database
@@ -1210,29 +2008,27 @@ async def api_health():
                 "status": clip_status,
                 "available": clip_status == "normal"
             },
-            "timestamp": datetime.now().isoformat()
+            "query_cache": query_cache_stats(),
+            "timestamp": _NOW_ISO
         }
+        return ORJSONResponse(content=health)
         
     except Exception as e:
         logger.error(f"健康檢查失敗: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={
                 "success": False,
                 "status": "unhealthy",
                 "error": str(e),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": _NOW_ISO
             }
         )
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 # ===== 用戶互動API =====
 @app.post("/api/report_incorrect_match")
 async def api_report_incorrect_match(request: dict):
     """回報錯誤匹配 - PostgreSQL版本"""
-    conn = None
     try:
         book_id = request.get('book_id')
         feedback = request.get('user_feedback')
@@ -1241,12 +2037,10 @@ async def api_report_incorrect_match(request: dict):
         
         # 可以選擇性地將回報記錄到資料庫
         if book_id:
-            conn = db_config.get_connection()
-            cursor = conn.cursor()
-            
-            # 檢查書籍是否存在
-            cursor.execute("SELECT title FROM books WHERE id = %s", (book_id,))
-            book = cursor.fetchone()
+            pool = await db_config.get_async_pool()
+            async with pool.acquire() as conn:
+                # 檢查書籍是否存在
+                book = await conn.fetchrow(GET_BOOK_TITLE_SQL, int(book_id))
             
             if book:
                 logger.info(f"📝 錯誤回報記錄：書籍'{book['title']}'(ID:{book_id}) - {feedback}")
@@ -1259,16 +2053,13 @@ async def api_report_incorrect_match(request: dict):
         
     except Exception as e:
         logger.error(f"回報錯誤匹配異常: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
                 "message": f"回報失敗: {str(e)}"
             }
         )
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 @app.post("/api/suggest_new_book")
 async def api_suggest_new_book(request: dict):
@@ -1280,7 +2071,7 @@ async def api_suggest_new_book(request: dict):
         image = request.get('image', '')
         
         if not title:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=400,
                 content={
                     "success": False,
@@ -1290,8 +2081,17 @@ async def api_suggest_new_book(request: dict):
         
         logger.info(f"收到新書建議: {title}")
         
+        try:
+            image_bytes = decode_base64_image(image)
+        except Exception as e:
+            logger.error(f"Base64 解碼失敗: {e}")
+            return {
+                "success": False,
+                "message": f"建議處理失敗: 圖片格式錯誤: {str(e)}"
+            }
+        
         success, message = await save_book_with_rotation_enhanced(
-            title, isbn, url, image
+            title, isbn, url, image_bytes
         )
         
         return {
@@ -1301,7 +2101,7 @@ async def api_suggest_new_book(request: dict):
         
     except Exception as e:
         logger.error(f"建議新書異常: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -1319,7 +2119,7 @@ async def api_suggest_new_book_file(
     """建議新增書籍 - 檔案格式 PostgreSQL版本"""
     try:
         if not title.strip():
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=400,
                 content={
                     "success": False,
@@ -1330,7 +2130,7 @@ async def api_suggest_new_book_file(
         logger.info(f"收到新書檔案建議: {title}")
         
         success, message = await save_book_with_rotation_enhanced(
-            title.strip(), isbn.strip(), url.strip(), image
+            title.strip(), isbn.strip(), url.strip(), await image.read()
         )
         
         return {
@@ -1340,7 +2140,78 @@ async def api_suggest_new_book_file(
         
     except Exception as e:
         logger.error(f"建議新書檔案異常: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "message": f"建議處理失敗: {str(e)}"
+            }
+        )
+
+# 單次批次新增的書籍上限 (所有封面會合併為一個 CLIP 批次)
+BULK_MAX_BOOKS = int(os.getenv('BULK_MAX_BOOKS', '50'))
+
+@app.post("/api/suggest_new_books_bulk")
+async def api_suggest_new_books_bulk(bulk_data: BulkBookModel):
+    """批次建議新增書籍 - JSON格式 PostgreSQL版本"""
+    try:
+        if not bulk_data.books:
+            return ORJSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": "書籍列表不能為空"
+                }
+            )
+        
+        if len(bulk_data.books) > BULK_MAX_BOOKS:
+            return ORJSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "message": f"一次最多新增 {BULK_MAX_BOOKS} 本書籍"
+                }
+            )
+        
+        books = []
+        for index, book in enumerate(bulk_data.books):
+            title = book.title.strip()
+            if not title:
+                return ORJSONResponse(
+                    status_code=400,
+                    content={
+                        "success": False,
+                        "message": f"第 {index + 1} 本書的書名不能為空"
+                    }
+                )
+            try:
+                image_bytes = decode_base64_image(book.image)
+            except Exception as e:
+                logger.error(f"Base64 解碼失敗: {e}")
+                return {
+                    "success": False,
+                    "message": f"建議處理失敗: 第 {index + 1} 本書圖片格式錯誤: {str(e)}"
+                }
+            if len(image_bytes) > 10 * 1024 * 1024:  # 10MB，與檔案上傳路由相同
+                return {
+                    "success": False,
+                    "message": f"建議處理失敗: 第 {index + 1} 本書圖片過大: {len(image_bytes) / 1024 / 1024:.1f}MB (限制: 10MB)"
+                }
+            books.append((title, (book.isbn or "").strip(), (book.url or "").strip(), image_bytes))
+        
+        logger.info(f"收到批次新書建議: {len(books)} 本")
+        
+        success, message, book_ids = await save_books_bulk_enhanced(books)
+        
+        return {
+            "success": success,
+            "message": message if success else f"建議處理失敗: {message}",
+            "ids": book_ids
+        }
+        
+    except Exception as e:
+        logger.error(f"批次建議新書異常: {e}")
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -1349,11 +2220,66 @@ async def api_suggest_new_book_file(
         )
 
 # ===== 調試API =====
+# 調試用資料庫狀態查詢: 版本、表格、欄位結構、筆數、最近記錄、索引與資料庫大小
+# 以 to_jsonb(b) 取 cover_path / created_at，欄位不存在時不會造成查詢錯誤
+DEBUG_DATABASE_SQL = """
+    SELECT json_build_object(
+        'postgresql_version', version(),
+        'tables', (
+            SELECT COALESCE(json_agg(table_name), '[]')
+            FROM information_schema.tables
+            WHERE table_schema = 'public'
+        ),
+        'books_table_structure', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'name', column_name,
+                'type', data_type,
+                'nullable', is_nullable = 'YES',
+                'default', column_default
+            ) ORDER BY ordinal_position), '[]')
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'books'
+        ),
+        'books_count', (SELECT count(*) FROM books),
+        'recent_books', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'id', b.id,
+                'title', b.title,
+                'cover_path', COALESCE(to_jsonb(b) -> 'cover_path', '"欄位不存在"'::jsonb),
+                'created_at', to_jsonb(b) -> 'created_at'
+            ) ORDER BY b.id DESC), '[]')
+            FROM (SELECT * FROM books ORDER BY id DESC LIMIT 5) b
+        ),
+        'embeddings_table_structure', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'name', column_name,
+                'type', data_type
+            ) ORDER BY ordinal_position), '[]')
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'cover_embeddings'
+        ),
+        'embeddings_count', (SELECT count(*) FROM cover_embeddings),
+        'recent_embeddings', (
+            SELECT COALESCE(json_agg(book_id ORDER BY book_id DESC), '[]')
+            FROM (SELECT book_id FROM cover_embeddings ORDER BY book_id DESC LIMIT 5) e
+        ),
+        'books_indexes', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'name', indexname,
+                'definition', indexdef
+            )), '[]')
+            FROM pg_indexes
+            WHERE tablename = 'books'
+        ),
+        'database_size', pg_size_pretty(pg_database_size(current_database()))
+    )::text
+"""
+
 @app.get("/api/debug/database")
 async def api_debug_database():
     """調試端點：檢查資料庫狀態 - PostgreSQL版本"""
-    conn = None
     try:
+        pool = await db_config.get_async_pool()
         result = {
             "database_type": "PostgreSQL",
             "host": db_config.host,
@@ -1361,115 +2287,29 @@ async def api_debug_database():
             "database": db_config.database,
             "user": db_config.user,
             "connection_pool": {
-                "available": db_config.pool is not None,
-                "pool_info": "ThreadedConnectionPool" if db_config.pool else "None"
+                "available": True,
+                "pool_info": "asyncpg.Pool",
+                "size": pool.get_size(),
+                "idle": pool.get_idle_size(),
+                "min_size": pool.get_min_size(),
+                "max_size": pool.get_max_size()
             }
         }
         
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        # 檢查資料庫版本
-        cursor.execute("SELECT version()")
-        result["postgresql_version"] = cursor.fetchone()[0]
-        
-        # 檢查所有表格
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-        """)
-        tables = [row[0] for row in cursor.fetchall()]
-        result["tables"] = tables
-        
-        # 檢查 books 表格結構
-        if "books" in tables:
-            cursor.execute("""
-                SELECT column_name, data_type, is_nullable, column_default
-                FROM information_schema.columns 
-                WHERE table_schema = 'public' 
-                AND table_name = 'books'
-                ORDER BY ordinal_position
-            """)
-            books_columns = [
-                {
-                    "name": row[0], 
-                    "type": row[1], 
-                    "nullable": row[2] == 'YES', 
-                    "default": row[3]
-                } 
-                for row in cursor.fetchall()
-            ]
-            result["books_table_structure"] = books_columns
-            
-            # 書籍總數
-            cursor.execute("SELECT COUNT(*) FROM books")
-            result["books_count"] = cursor.fetchone()[0]
-            
-            # 最近的書籍
-            column_names = [col["name"] for col in books_columns]
-            if "cover_path" in column_names:
-                cursor.execute("""
-                    SELECT id, title, cover_path, created_at 
-                    FROM books 
-                    ORDER BY id DESC 
-                    LIMIT 5
-                """)
-                result["recent_books"] = [
-                    {
-                        "id": row[0], 
-                        "title": row[1], 
-                        "cover_path": row[2],
-                        "created_at": row[3].isoformat() if row[3] else None
-                    } 
-                    for row in cursor.fetchall()
-                ]
-            else:
-                cursor.execute("SELECT id, title FROM books ORDER BY id DESC LIMIT 5")
-                result["recent_books"] = [
-                    {"id": row[0], "title": row[1], "cover_path": "欄位不存在"} 
-                    for row in cursor.fetchall()
-                ]
-        
-        # 檢查 cover_embeddings 表格
-        if "cover_embeddings" in tables:
-            cursor.execute("""
-                SELECT column_name, data_type
-                FROM information_schema.columns 
-                WHERE table_schema = 'public' 
-                AND table_name = 'cover_embeddings'
-                ORDER BY ordinal_position
-            """)
-            embeddings_columns = [
-                {"name": row[0], "type": row[1]} 
-                for row in cursor.fetchall()
-            ]
-            result["embeddings_table_structure"] = embeddings_columns
-            
-            cursor.execute("SELECT COUNT(*) FROM cover_embeddings")
-            result["embeddings_count"] = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT book_id FROM cover_embeddings ORDER BY book_id DESC LIMIT 5")
-            result["recent_embeddings"] = [row[0] for row in cursor.fetchall()]
-        
-        # 檢查索引
-        cursor.execute("""
-            SELECT indexname, indexdef 
-            FROM pg_indexes 
-            WHERE tablename = 'books'
-        """)
-        result["books_indexes"] = [
-            {"name": row[0], "definition": row[1]} 
-            for row in cursor.fetchall()
-        ]
-        
-        # 資料庫大小
-        cursor.execute("""
-            SELECT pg_size_pretty(pg_database_size(%s))
-        """, (db_config.database,))
-        result["database_size"] = cursor.fetchone()[0]
-        
-        return result
+        # 所有檢查合併為單一查詢 (一次往返)，由 PostgreSQL 組成 JSON
+        async with pool.acquire() as conn:
+            try:
+                result.update(orjson.loads(await conn.fetchval(DEBUG_DATABASE_SQL)))
+            except asyncpg.UndefinedTableError:
+                # 表格尚未建立 (ensure_table 未成功)，只回報版本與現有表格
+                result["postgresql_version"] = await conn.fetchval("SELECT version()")
+                result["tables"] = [row['table_name'] for row in await conn.fetch("""
+                    SELECT table_name 
+                    FROM information_schema.tables 
+                    WHERE table_schema = 'public'
+                """)]
+        
+        return ORJSONResponse(content=result)
         
     except Exception as e:
         error_result = {
@@ -1479,63 +2319,50 @@ async def api_debug_database():
             "database_type": "PostgreSQL",
             "connection_error": True
         }
-        logger.error(f"❌ PostgreSQL調試檢查失敗: {error_result}")
+        log_exception("❌ PostgreSQL調試檢查失敗", e)
         return error_result
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 @app.post("/api/debug/fix_database")
 async def api_fix_database():
     """修復資料庫結構 - PostgreSQL版本"""
-    conn = None
     try:
         logger.info("🔧 開始修復PostgreSQL資料庫結構")
         
         # 重新執行表格檢查和修復
-        ensure_table()
-        
-        conn = db_config.get_connection()
-        cursor = conn.cursor()
-        
-        # 檢查表格結構
-        cursor.execute("""
-            SELECT column_name, data_type
-            FROM information_schema.columns 
-            WHERE table_schema = 'public' 
-            AND table_name = 'books'
-            ORDER BY ordinal_position
-        """)
-        books_columns = [f"{row[0]}({row[1]})" for row in cursor.fetchall()]
-        
-        # 統計資料
-        cursor.execute("SELECT COUNT(*) FROM books")
-        books_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM cover_embeddings")
-        embeddings_count = cursor.fetchone()[0]
-        
-        # 檢查索引是否存在
-        cursor.execute("""
-            SELECT indexname 
-            FROM pg_indexes 
-            WHERE tablename = 'books'
-        """)
-        indexes = [row[0] for row in cursor.fetchall()]
-        
-        # 如果索引不存在，重新建立
-        required_indexes = ["idx_books_title", "idx_books_created_at"]
-        missing_indexes = [idx for idx in required_indexes if idx not in indexes]
-        
-        if missing_indexes:
-            logger.info(f"🔨 重新建立缺失的索引: {missing_indexes}")
-            for idx in missing_indexes:
-                if idx == "idx_books_title":
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books USING btree (title)")
-                elif idx == "idx_books_created_at":
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_created_at ON books USING btree (created_at DESC)")
-        
-        conn.commit()
+        await ensure_table()
+        
+        pool = await db_config.get_async_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # 檢查表格結構
+                books_columns = [f"{row['column_name']}({row['data_type']})" for row in await conn.fetch("""
+                    SELECT column_name, data_type
+                    FROM information_schema.columns 
+                    WHERE table_schema = 'public' 
+                    AND table_name = 'books'
+                    ORDER BY ordinal_position
+                """)]
+                
+                # 統計資料
+                books_count = await conn.fetchval("SELECT COUNT(*) FROM books")
+                embeddings_count = await conn.fetchval("SELECT COUNT(*) FROM cover_embeddings")
+                
+                # 檢查索引是否存在
+                indexes = [row['indexname'] for row in await conn.fetch("""
+                    SELECT indexname 
+                    FROM pg_indexes 
+                    WHERE tablename = 'books'
+                """)]
+                
+                # 如果索引不存在，重新建立
+                required_indexes = ["idx_books_created_at"]
+                missing_indexes = [idx for idx in required_indexes if idx not in indexes]
+                
+                if missing_indexes:
+                    logger.info(f"🔨 重新建立缺失的索引: {missing_indexes}")
+                    for idx in missing_indexes:
+                        if idx == "idx_books_created_at":
+                            await conn.execute("CREATE INDEX IF NOT EXISTS idx_books_created_at ON books USING btree (created_at DESC)")
         
         result = {
             "success": True,
@@ -1554,20 +2381,14 @@ async def api_fix_database():
         return result
         
     except Exception as e:
-        if conn:
-            conn.rollback()
-        
         error_result = {
             "success": False,
             "error": str(e),
             "traceback": traceback.format_exc(),
             "database_type": "PostgreSQL"
         }
-        logger.error(f"❌ PostgreSQL修復失敗: {error_result}")
+        log_exception("❌ PostgreSQL修復失敗", e)
         return error_result
-    finally:
-        if conn:
-            db_config.return_connection(conn)
 
 
 
@@ -1600,10 +2421,15 @@ if __name__ == "__main__":
     host = os.getenv('APP_HOST', '0.0.0.0')
     port = int(os.getenv('PORT', os.getenv('APP_PORT', '8000')))  # Railway 使用 PORT 環境變數
 
+    # uvloop + httptools (uvicorn[standard] 已包含；uvloop 不支援 Windows)
+    # 直接執行時本進程已載入 CLIP 模型，因此直接以此進程內的 app 單進程服務，
+    # 不以匯入字串另開 worker/reloader (否則每個進程都會再載入一份模型)；
+    # 多 worker 或開發用 reload 請改用 main.py (啟動器不匯入本模組)
     uvicorn.run(
-        "app_3:app", 
+        app, 
         host=host, 
         port=port, 
-        reload=False,  # 生產環境建議設為 False
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
         log_level="info"
     )
\ No newline at end of file
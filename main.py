@@ -1,10 +1,32 @@
 # main.py - Railway 入口點
-from app_3 import app
+# 啟動器本身不匯入 app_3: 模型 (CLIP) 只在 uvicorn 的 worker 中載入，啟動器不多佔一份記憶體/CUDA context
+
+
+def __getattr__(name):
+    # 相容 `uvicorn main:app`: 只有在真正取用 app 時才載入 (PEP 562)
+    if name == "app":
+        from app_3 import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Railway 會自動偵測這個檔案並啟動
 if __name__ == "__main__":
+    import sys
     import uvicorn
     import os
     
     port = int(os.getenv('PORT', '8000'))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # uvloop + httptools；生產環境不開 reload
+    # 預設單一 worker: 每個 worker 各自載入一份 CLIP 模型並各有一個合併批次佇列，
+    # 並行處理由事件迴圈與推論工作者負責；需要多進程時以 WEB_CONCURRENCY 指定
+    reload = os.getenv('ENV') == 'dev'
+    uvicorn.run(
+        "app_3:app",
+        host="0.0.0.0",
+        port=port,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        reload=reload,
+        workers=None if reload else int(os.getenv('WEB_CONCURRENCY', '1'))
+    )
\ No newline at end of file
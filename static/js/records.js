@@ -5,24 +5,35 @@ let allBooks = [];
 async function loadBooks() {
     try {
         console.log('開始載入FastAPI書籍記錄...');
-        const response = await fetch('/api/books');
-        
-        if (!response.ok) {
-            throw new Error('HTTP ' + response.status);
-        }
-        
-        const result = await response.json();
-        console.log('FastAPI回應:', result);
         
+        // 依 next_before_id 逐頁載入全部書籍
         let books = [];
-        if (result.success && Array.isArray(result.data)) {
-            books = result.data;
-        } else if (Array.isArray(result)) {
-            books = result;
-        } else {
-            console.error('未知的回應格式:', result);
-            books = [];
-        }
+        let beforeId = null;
+        do {
+            let url = '/api/books?limit=500';
+            if (beforeId !== null) {
+                url += '&before_id=' + beforeId;
+            }
+            const response = await fetch(url);
+            
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            
+            const result = await response.json();
+            console.log('FastAPI回應:', result);
+            
+            if (result.success && Array.isArray(result.data)) {
+                books = books.concat(result.data);
+                beforeId = result.next_before_id ?? null;
+            } else if (Array.isArray(result)) {
+                books = result;
+                beforeId = null;
+            } else {
+                console.error('未知的回應格式:', result);
+                beforeId = null;
+            }
+        } while (beforeId !== null);
         
         allBooks = books;
         console.log('載入書籍數量:', allBooks.length);
@@ -109,7 +120,7 @@ function displayBooks(books) {
             techBadge = '<span class="enhanced-indicator">CLIP增強</span>';
         }
         
-        const imageUrl = '/api/image/' + book.id + '?t=' + Date.now();
+        const imageUrl = '/api/image/' + book.id;
         
         html += '<div class="book-card">';
         html += '  <div class="book-image">';